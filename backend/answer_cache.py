@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import os, re, json, time, hashlib
+from collections import OrderedDict
+from pathlib import Path
+
+CACHE_TTL = float(os.environ.get("ULTRA_AI_CACHE_TTL", str(6 * 3600)))
+CACHE_MAX_ENTRIES = int(os.environ.get("ULTRA_AI_CACHE_ENTRIES", "512"))
+CACHE_MAX_BYTES = int(float(os.environ.get("ULTRA_AI_CACHE_MB", "8")) * 1024 * 1024)
+
+def normalize(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    text = re.sub(r"\s+", " ", (text or "").strip().lower())
+    return text.rstrip(" ?!.")
+
+class AnswerCache:
+    """
+    Bounded LRU answer cache with TTL and a byte budget. Entries are keyed on
+    normalized text, role, model name and sampling params, and optionally
+    appended to a JSONL file so they survive restarts.
+    """
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL, path: Path | None = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()   # key -> (expires, size, value)
+        self.bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "stores": 0}
+        self._appended = 0
+        if path:
+            self._load()
+
+    @staticmethod
+    def key(text: str, role: str, model: str | None, params: dict | None = None) -> str:
+        raw = json.dumps([normalize(text), role, model or "", params or {}], sort_keys=True)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        item = self._entries.get(key)
+        if item is None:
+            self.stats["misses"] += 1
+            return None
+        expires, size, value = item
+        if expires < time.time():
+            self._drop(key)
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return value
+
+    def put(self, key: str, value: dict, ttl: float | None = None):
+        expires = time.time() + (ttl or self.ttl)
+        self._insert(key, expires, value)
+        self.stats["stores"] += 1
+        if self.path:
+            self._append({"k": key, "e": expires, "v": value})
+
+    def _insert(self, key, expires, value):
+        size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (expires, size, value)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.stats["evictions"] += 1
+
+    def _drop(self, key):
+        expires, size, value = self._entries.pop(key)
+        self.bytes -= size
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        now = time.time()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except Exception:
+                        continue
+                    if rec.get("e", 0) > now:
+                        self._insert(rec["k"], rec["e"], rec["v"])
+        except Exception as e:
+            print(f"Answer cache load error: {e}")
+        self._compact()
+
+    def _append(self, rec):
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._appended += 1
+            if self._appended > 2 * max(len(self._entries), 64):
+                self._compact()
+        except Exception as e:
+            print(f"Answer cache write error: {e}")
+
+    def _compact(self):
+        """Rewrite the JSONL file with only live entries."""
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for k, (expires, size, value) in self._entries.items():
+                    f.write(json.dumps({"k": k, "e": expires, "v": value}, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.path)
+            self._appended = len(self._entries)
+        except Exception as e:
+            print(f"Answer cache compact error: {e}")
+
+    def snapshot(self) -> dict:
+        total = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "entries": len(self._entries), "bytes": self.bytes,
+                "hit_ratio": round(self.stats["hits"] / total, 3) if total else 0.0}
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import os, time
+from sessions import count_tokens, CHARS_PER_TOKEN
+
+# Per-request time budget. Requests may ask for their own with "deadline_s".
+DEFAULT_DEADLINE_S = float(os.environ.get("ULTRA_AI_DEADLINE", "120"))
+MAX_DEADLINE_S = 600.0
+MIN_STAGE_S = 2.0           # never start a model call with less time left than this
+OPTIONAL_STAGE_S = float(os.environ.get("ULTRA_AI_OPTIONAL_STAGE_S", "8"))  # refine/polish cost before rates are known
+CONTEXT_MARGIN = 0.9        # token counts are estimated, so leave some of the window free
+MIN_N_PREDICT = 16
+
+class Deadline:
+    """Wall-clock budget for one request, shared by every stage it runs."""
+    def __init__(self, seconds=None):
+        try:
+            seconds = DEFAULT_DEADLINE_S if seconds is None else float(seconds)
+        except (TypeError, ValueError):
+            seconds = DEFAULT_DEADLINE_S
+        self.total = max(0.1, min(seconds, MAX_DEADLINE_S))
+        self.expires = time.monotonic() + self.total
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def allows(self, seconds: float) -> bool:
+        return self.remaining() >= seconds
+
+def n_predict_for(deadline: Deadline, default: int, rate: float | None) -> int:
+    """Cap n_predict at what a model decoding rate tokens/s can finish before the deadline."""
+    if not rate:
+        return default
+    return max(MIN_N_PREDICT, min(default, int(deadline.remaining() * rate * 0.9)))
+
+def stage_seconds(n_predict: int, rate: float | None) -> float:
+    """Expected duration of a generation, used to decide whether optional passes fit."""
+    return n_predict / rate + 1.0 if rate else OPTIONAL_STAGE_S
+
+def fit_prompt(template: str, n_ctx: int, n_predict: int, trim=("history", "notes", "draft", "text"), **fields) -> str:
+    """
+    Format template so prompt plus n_predict fits in n_ctx tokens. Fields
+    are shortened in trim order: history loses its oldest part, the others
+    keep their beginning.
+    """
+    prompt = template.format(**fields)
+    budget = int(n_ctx * CONTEXT_MARGIN) - n_predict
+    excess = count_tokens(prompt) - budget
+    for name in trim:
+        if excess <= 0:
+            break
+        value = fields.get(name) or ""
+        if not value:
+            continue
+        cut = min(len(value), excess * CHARS_PER_TOKEN)
+        fields[name] = value[cut:] if name == "history" else value[:len(value) - cut]
+        prompt = template.format(**fields)
+        excess = count_tokens(prompt) - budget
+    return prompt
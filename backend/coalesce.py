@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+import time, asyncio
+
+# A caller whose deadline is within this many seconds of the leader's joins
+# it; that little extra time could not buy another model call anyway
+JOIN_SLACK_S = 2.0
+
+class Flight:
+    """One in-flight pipeline run shared by a leader and its followers."""
+    def __init__(self):
+        self.task = None
+        self.expires = None     # leader's deadline (time.monotonic()), None if unbounded
+        self.events = []        # everything emitted so far, replayed to late joiners
+        self.queues = []        # one per streaming participant
+        self.waiters = 0
+        self.followers = 0
+
+    async def emit(self, event):
+        self.events.append(event)
+        for q in self.queues:
+            q.put_nowait(event)
+
+class SingleFlight:
+    """
+    In-flight deduplication: concurrent calls with the same key share one
+    run of the work. Streaming participants get the leader's events
+    (buffered ones first, then live) through their own queue, so a slow
+    client never stalls the pipeline. The shared run is cancelled only when
+    every participant has gone away.
+
+    The shared run works within the leader's deadline, so a caller with
+    noticeably more time (expires later than the leader's by more than
+    JOIN_SLACK_S) runs the work itself instead of joining and getting an
+    answer cut short by someone else's budget.
+    """
+    def __init__(self):
+        self.flights = {}
+        self.stats = {"leaders": 0, "followers": 0, "max_followers": 0, "abandoned": 0, "outlived": 0}
+
+    def _finish(self, key, flight):
+        if self.flights.get(key) is flight:
+            self.flights.pop(key)
+        for q in flight.queues:
+            q.put_nowait(None)
+
+    async def run(self, key, fn, emit=None, expires=None) -> dict:
+        """
+        Return fn(emit)'s result, where fn is started only if no call with
+        key is already running. Followers' results carry "coalesced": True.
+        expires (time.monotonic()) is this caller's deadline: a follower
+        gets TimeoutError once it passes, while the shared run goes on.
+        """
+        flight = self.flights.get(key)
+        leader = flight is None or flight.task.done()
+        if not leader and expires is not None and flight.expires is not None and expires > flight.expires + JOIN_SLACK_S:
+            self.stats["outlived"] += 1
+            return await fn(emit)
+        if leader:
+            flight = Flight()
+            flight.expires = expires
+            self.flights[key] = flight
+            flight.task = asyncio.ensure_future(fn(flight.emit))
+            flight.task.add_done_callback(lambda t: self._finish(key, flight))
+            self.stats["leaders"] += 1
+        else:
+            flight.followers += 1
+            self.stats["followers"] += 1
+            self.stats["max_followers"] = max(self.stats["max_followers"], flight.followers)
+
+        flight.waiters += 1
+        queue = None
+        if emit:
+            queue = asyncio.Queue()
+            for event in flight.events:
+                queue.put_nowait(event)
+            flight.queues.append(queue)
+        async def wait():
+            if queue:
+                while (event := await queue.get()) is not None:
+                    await emit(event)
+            return await asyncio.shield(flight.task)
+
+        try:
+            if leader or expires is None:
+                result = await wait()
+            else:
+                result = await asyncio.wait_for(wait(), max(0.0, expires - time.monotonic()))
+        finally:
+            flight.waiters -= 1
+            if queue:
+                flight.queues.remove(queue)
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self.stats["abandoned"] += 1
+        return result if leader else {**result, "coalesced": True}
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "in_flight": len(self.flights),
+                "followers_in_flight": sum(f.followers for f in self.flights.values())}
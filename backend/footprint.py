@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import os, mmap, struct
+
+# Memory model for a llama-server process (MB are MiB)
+KV_BYTES = 2                # f16 K and V cache entries
+N_UBATCH = 512              # llama.cpp default physical batch; sizes logits and KQ buffers
+OVERHEAD_MB = 100           # runtime, tokenizer, server threads
+DEFAULT_FOOTPRINT_MB = 2200 # used only when the file is missing or unreadable
+
+# ggml tensor type -> (block size, bytes per block)
+GGML_TYPES = {
+    0: (1, 4), 1: (1, 2), 2: (32, 18), 3: (32, 20), 6: (32, 22), 7: (32, 24), 8: (32, 34), 9: (32, 36),
+    10: (256, 84), 11: (256, 110), 12: (256, 144), 13: (256, 176), 14: (256, 210), 15: (256, 292),
+    16: (256, 66), 17: (256, 74), 18: (256, 98), 19: (256, 50), 20: (32, 18), 21: (256, 110),
+    22: (256, 82), 23: (256, 136), 24: (1, 1), 25: (1, 2), 26: (1, 4), 27: (1, 8), 28: (1, 8),
+    29: (256, 56), 30: (1, 2), 34: (256, 54), 35: (256, 66),
+}
+# GGUF metadata value type -> struct format for fixed-size scalars
+SCALARS = {0: "<B", 1: "<b", 2: "<H", 3: "<h", 4: "<I", 5: "<i", 6: "<f", 7: "<?", 10: "<Q", 11: "<q", 12: "<d"}
+STRING, ARRAY = 8, 9
+
+class GGUFError(Exception):
+    pass
+
+class _Reader:
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+
+    def unpack(self, fmt):
+        vals = struct.unpack_from(fmt, self.buf, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return vals[0]
+
+    def string(self):
+        n = self.unpack("<Q")
+        s = bytes(self.buf[self.pos:self.pos + n])
+        self.pos += n
+        return s.decode("utf-8", errors="replace")
+
+    def value(self, vtype, keep_array=True):
+        if vtype in SCALARS:
+            return self.unpack(SCALARS[vtype])
+        if vtype == STRING:
+            return self.string()
+        if vtype == ARRAY:
+            itype, n = self.unpack("<I"), self.unpack("<Q")
+            if itype in SCALARS and not keep_array:
+                # Skip fixed-size arrays without decoding them
+                self.pos += struct.calcsize(SCALARS[itype]) * n
+                return n
+            items = [self.value(itype, keep_array) for _ in range(n)]
+            return items if keep_array else n
+        raise GGUFError(f"unknown metadata type {vtype}")
+
+def read_header(path) -> dict:
+    """
+    Parse a GGUF file's metadata and tensor table through mmap, without
+    touching the tensor data. Large arrays (the tokenizer vocabulary) are
+    returned as their length only.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        r = _Reader(mm)
+        if mm[:4] != b"GGUF":
+            raise GGUFError("not a GGUF file")
+        r.pos = 4
+        version = r.unpack("<I")
+        if version < 2:
+            raise GGUFError(f"unsupported GGUF version {version}")
+        n_tensors, n_kv = r.unpack("<Q"), r.unpack("<Q")
+        meta = {}
+        for _ in range(n_kv):
+            key = r.string()
+            vtype = r.unpack("<I")
+            # Per-layer arrays (e.g. head_count_kv) are small; vocab-sized ones are skipped
+            meta[key] = r.value(vtype, keep_array=not key.startswith("tokenizer."))
+        tensor_bytes, known = 0, True
+        for _ in range(n_tensors):
+            r.string()
+            n_dims = r.unpack("<I")
+            n = 1
+            for _ in range(n_dims):
+                n *= r.unpack("<Q")
+            ttype = r.unpack("<I")
+            r.unpack("<Q")
+            if ttype in GGML_TYPES:
+                block, size = GGML_TYPES[ttype]
+                tensor_bytes += n // block * size
+            else:
+                known = False
+        align = int(meta.get("general.alignment", 32))
+        data_start = (r.pos + align - 1) // align * align
+        file_bytes = len(mm)
+    return {"version": version, "n_tensors": n_tensors, "meta": meta,
+            "weights_bytes": tensor_bytes if known else file_bytes - data_start, "file_bytes": file_bytes}
+
+def model_dims(header) -> dict:
+    """Architecture numbers that size the KV cache and compute buffers."""
+    meta = header["meta"]
+    arch = meta.get("general.architecture", "llama")
+    get = lambda k, d=None: meta.get(f"{arch}.{k}", d)
+    n_layer = int(get("block_count", 32))
+    n_embd = int(get("embedding_length", 4096))
+    n_head = get("attention.head_count", 32)
+    n_head = max(n_head) if isinstance(n_head, list) else int(n_head)
+    n_head_kv = get("attention.head_count_kv", n_head)
+    per_layer_kv = n_head_kv if isinstance(n_head_kv, list) else [int(n_head_kv)] * n_layer
+    head_dim = n_embd // max(1, n_head)
+    n_vocab = get("vocab_size") or meta.get("tokenizer.ggml.tokens") or 32000
+    return {"arch": arch, "n_layer": n_layer, "n_embd": n_embd, "n_head": n_head,
+            "kv_heads_total": sum(per_layer_kv), "k_len": int(get("attention.key_length", head_dim)),
+            "v_len": int(get("attention.value_length", head_dim)), "n_vocab": int(n_vocab)}
+
+def estimate_mb(header, n_ctx: int) -> dict:
+    """
+    Expected RSS in MiB for a server with n_ctx total context: mmapped
+    weights (all pages are touched every token), the f16 KV cache, the
+    logits/attention compute buffers and a fixed runtime overhead.
+    """
+    d = model_dims(header)
+    mib = 1024 * 1024
+    kv = d["kv_heads_total"] * n_ctx * (d["k_len"] + d["v_len"]) * KV_BYTES
+    compute = (d["n_vocab"] + d["n_head"] * n_ctx) * N_UBATCH * 4
+    out = {"weights_mb": header["weights_bytes"] // mib, "kv_mb": kv // mib,
+           "compute_mb": compute // mib, "overhead_mb": OVERHEAD_MB}
+    out["total_mb"] = sum(out.values())
+    return {**out, "n_ctx": n_ctx, **d}
+
+class FootprintEstimator:
+    """Per-model RSS estimates, cached by file path, size, mtime and context."""
+    def __init__(self):
+        self._cache = {}
+        self.stats = {"parsed": 0, "cache_hits": 0, "fallbacks": 0}
+
+    def estimate(self, model) -> dict:
+        n_ctx = int(model.get("context", 4096)) * max(1, int(model.get("slots", 1)))
+        path = model.get("path", "")
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.stats["fallbacks"] += 1
+            return {"total_mb": DEFAULT_FOOTPRINT_MB, "source": "default"}
+        key = (path, st.st_size, st.st_mtime_ns, n_ctx)
+        hit = self._cache.get(key)
+        if hit:
+            self.stats["cache_hits"] += 1
+            return hit
+        try:
+            est = {**estimate_mb(read_header(path), n_ctx), "source": "gguf"}
+            self.stats["parsed"] += 1
+        except Exception as e:
+            print(f"GGUF estimate error for {path}: {e}")
+            # Weights plus the old per-context KV allowance
+            est = {"total_mb": st.st_size // (1024 * 1024) + n_ctx // 8 + 200, "source": "file_size"}
+            self.stats["fallbacks"] += 1
+        self._cache[key] = est
+        return est
+
+    def snapshot(self) -> dict:
+        models = {key[0].rsplit("/", 1)[-1]: {k: v for k, v in est.items() if k.endswith("_mb") or k == "n_ctx"}
+                  for key, est in self._cache.items()}
+        return {**self.stats, "models": models}
+
+ESTIMATOR = FootprintEstimator()
+
+def estimate_footprint_mb(model) -> int:
+    return ESTIMATOR.estimate(model)["total_mb"]
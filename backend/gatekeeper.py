@@ -1,21 +1,22 @@
 #!/usr/bin/env python3
-import json, asyncio, aiohttp
+import json, asyncio
+from http_client import get_client, stream_text
 
-async def gatekeeper_answer(port: int, prompt: str, ctx: int = 4096, n_predict: int = 256, temp: float = 0.7):
-    url = f"http://127.0.0.1:{port}/completion"
+async def gatekeeper_answer(port: int, prompt: str, ctx: int = 4096, n_predict: int = 256, temp: float = 0.7, on_token=None, slot=None, expires=None):
     payload = {
         "prompt": prompt,
         "n_predict": n_predict,
         "temperature": temp,
         "cache_prompt": True
     }
+    if slot is not None:
+        payload["id_slot"] = slot
     try:
-        async with aiohttp.ClientSession() as sess:
-            async with sess.post(url, json=payload, timeout=30) as r:
-                r.raise_for_status()
-                data = await r.json()
-                text = data.get("content") or data.get("text") or ""
-                return text.strip()
+        if on_token is None:
+            data = await get_client().completion("gatekeeper", port, payload, expires=expires)
+            text = data.get("content") or data.get("text") or ""
+            return text.strip()
+        return await stream_text("gatekeeper", port, payload, on_token, expires=expires)
     except Exception as e:
         print(f"Gatekeeper error: {e}")
         return ""
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+import json, time, asyncio, aiohttp
+from contextlib import asynccontextmanager
+from metrics import Histogram
+from tracing import TRACER
+
+# Per-role request timeouts (seconds) and in-flight caps. Timeouts match the
+# values the role modules used when they opened their own sessions.
+ROLE_TIMEOUTS = {"gatekeeper": 30, "librarian": 25, "specialist": 60}
+ROLE_CONCURRENCY = {"gatekeeper": 4, "librarian": 4, "specialist": 2}
+KEEPALIVE_SECONDS = 60
+# llama.cpp timing fields recorded on each model call's trace span
+TIMING_FIELDS = ("prompt_n", "prompt_ms", "predicted_n", "predicted_ms", "predicted_per_second")
+DEFAULT_PORT_SLOTS = 1      # llama-server processes one request per slot (--parallel)
+
+def _time_left(timeout: float, expires: float | None) -> float:
+    """timeout capped by what is left before expires (a time.monotonic() value)."""
+    if expires is None:
+        return timeout
+    left = expires - time.monotonic()
+    if left <= 0:
+        raise asyncio.TimeoutError("request deadline expired")
+    return min(timeout, left)
+
+async def _acquire(sem: asyncio.Semaphore, expires: float | None):
+    if expires is None:
+        await sem.acquire()
+    else:
+        await asyncio.wait_for(sem.acquire(), max(0.0, expires - time.monotonic()))
+
+class LlamaHTTP:
+    """
+    App-lifetime HTTP client for the llama.cpp servers.
+    One keep-alive connection pool per port, shared by every role module.
+    """
+    def __init__(self):
+        self._sessions = {}
+        self._sems = {role: asyncio.Semaphore(n) for role, n in ROLE_CONCURRENCY.items()}
+        self.stats = {"requests": 0, "errors": 0, "new_connections": 0, "reused_connections": 0, "queued_while_warming": 0,
+                      "expired_in_queue": 0}
+        self._warming = {}              # port -> future resolved when the server is ready
+        self.port_limits = {}           # port -> in-flight cap (llama.cpp slots)
+        self._port_sems = {}            # port -> (semaphore, free slot ids)
+        self.slot_dispatch = {}         # port -> {slot id: requests sent to it}
+        self.port_waits = {}            # port -> Histogram of queue wait in ms
+        self.port_waiting = {}
+        self.usage = {}                 # port -> prompt/predicted/cached token totals
+
+    def _trace_config(self):
+        tc = aiohttp.TraceConfig()
+
+        async def on_create(session, ctx, params):
+            self.stats["new_connections"] += 1
+
+        async def on_reuse(session, ctx, params):
+            self.stats["reused_connections"] += 1
+
+        tc.on_connection_create_end.append(on_create)
+        tc.on_connection_reuseconn.append(on_reuse)
+        return tc
+
+    def session(self, port: int) -> aiohttp.ClientSession:
+        sess = self._sessions.get(port)
+        if sess is None or sess.closed:
+            conn = aiohttp.TCPConnector(limit=max(ROLE_CONCURRENCY.values()), keepalive_timeout=KEEPALIVE_SECONDS)
+            sess = aiohttp.ClientSession(connector=conn, trace_configs=[self._trace_config()])
+            self._sessions[port] = sess
+        return sess
+
+    def _semaphore(self, role: str) -> asyncio.Semaphore:
+        if role not in self._sems:
+            self._sems[role] = asyncio.Semaphore(ROLE_CONCURRENCY.get(role, 2))
+        return self._sems[role]
+
+    def set_port_limit(self, port: int, slots: int):
+        """Cap in-flight requests for port; takes effect for new waiters."""
+        if self.port_limits.get(port) != slots:
+            self.port_limits[port] = slots
+            self._port_sems.pop(port, None)
+
+    def _port_slots(self, port: int):
+        if port not in self._port_sems:
+            n = self.port_limits.get(port, DEFAULT_PORT_SLOTS)
+            # Free slot ids as a stack: the most recently used slot is
+            # handed out first since its KV cache is the warmest
+            self._port_sems[port] = (asyncio.Semaphore(n), list(range(n - 1, -1, -1)))
+        return self._port_sems[port]
+
+    @asynccontextmanager
+    async def _admit(self, role: str, port: int, timeout: float, slot: int | None = None, expires: float | None = None):
+        """
+        Wait for a warming server, then for a port slot and a role slot. Yields
+        the llama.cpp slot id the request owns (slot if it was free). With
+        expires (time.monotonic()), every wait raises TimeoutError once it passes.
+        """
+        try:
+            warming = self._warming.get(port)
+            if warming is not None:
+                self.stats["queued_while_warming"] += 1
+                await asyncio.wait_for(asyncio.shield(warming), _time_left(timeout, expires))
+            t0 = time.perf_counter()
+            self.port_waiting[port] = self.port_waiting.get(port, 0) + 1
+            admitted = False
+            role_sem = self._semaphore(role)
+            sem, free = self._port_slots(port)
+            try:
+                # Port first: a request queued behind a busy server must not
+                # hold role capacity that requests for an idle port of the
+                # same role (another specialist) could use
+                await _acquire(sem, expires)
+                try:
+                    await _acquire(role_sem, expires)
+                except BaseException:
+                    sem.release()
+                    raise
+                admitted = True
+                self.port_waiting[port] -= 1
+                wait_ms = (time.perf_counter() - t0) * 1000
+                self.port_waits.setdefault(port, Histogram()).observe(wait_ms)
+                self.stats["requests"] += 1
+                slot_id = slot if slot in free else free[-1]
+                free.remove(slot_id)
+                counts = self.slot_dispatch.setdefault(port, {})
+                counts[slot_id] = counts.get(slot_id, 0) + 1
+                TRACER.annotate(slot=slot_id, queue_wait_ms=round(wait_ms, 2))
+            finally:
+                if not admitted:
+                    self.port_waiting[port] -= 1
+        except asyncio.TimeoutError:
+            self.stats["expired_in_queue"] += 1
+            raise
+        try:
+            yield slot_id
+        finally:
+            free.append(slot_id)
+            sem.release()
+            role_sem.release()
+
+    def mark_warming(self, port: int, ready: asyncio.Future):
+        """Hold requests for port until ready resolves instead of failing them."""
+        self._warming[port] = ready
+        ready.add_done_callback(lambda f: self._warming.pop(port, None) if self._warming.get(port) is f else None)
+
+    async def health(self, port: int, timeout: float = 2.0) -> int | None:
+        """Return the HTTP status of GET /health, or None if nothing is listening."""
+        try:
+            t = aiohttp.ClientTimeout(total=timeout)
+            async with self.session(port).get(f"http://127.0.0.1:{port}/health", timeout=t) as r:
+                return r.status
+        except Exception:
+            return None
+
+    async def slot_action(self, port: int, slot_id: int, action: str, filename: str, timeout: float = 30.0) -> dict | None:
+        """POST /slots/{id}?action=save|restore; None if the server refused or is down."""
+        url = f"http://127.0.0.1:{port}/slots/{slot_id}?action={action}"
+        try:
+            t = aiohttp.ClientTimeout(total=timeout)
+            async with self.session(port).post(url, json={"filename": filename}, timeout=t) as r:
+                if r.status != 200:
+                    return None
+                return await r.json()
+        except Exception:
+            return None
+
+    def _record_usage(self, port: int, data: dict):
+        """Accumulate llama.cpp prompt/predicted/cached token counts per port."""
+        timings = data.get("timings") or {}
+        u = self.usage.setdefault(port, {"prompt_n": 0, "predicted_n": 0, "predicted_ms": 0.0, "tokens_cached": 0})
+        u["prompt_n"] += int(timings.get("prompt_n") or 0)
+        u["predicted_n"] += int(timings.get("predicted_n") or 0)
+        u["predicted_ms"] = round(u["predicted_ms"] + float(timings.get("predicted_ms") or 0), 1)
+        u["tokens_cached"] += int(data.get("tokens_cached") or 0)
+        TRACER.annotate(**{k: timings[k] for k in TIMING_FIELDS if k in timings},
+                        **({"tokens_cached": data["tokens_cached"]} if "tokens_cached" in data else {}))
+
+    def decode_rate(self, port: int) -> float | None:
+        """Observed generation speed on port in tokens/s, None until something was measured."""
+        u = self.usage.get(port)
+        if not u or u["predicted_ms"] <= 0 or u["predicted_n"] <= 0:
+            return None
+        return u["predicted_n"] / (u["predicted_ms"] / 1000)
+
+    async def completion(self, role: str, port: int, payload: dict, timeout: float | None = None,
+                         expires: float | None = None) -> dict:
+        """
+        POST a /completion request and return the decoded JSON body.
+        Raises on HTTP or connection errors; callers decide how to degrade.
+        payload["id_slot"] pins the request to that llama.cpp slot when it is
+        free (session affinity: the slot holds the conversation's KV cache).
+        expires (time.monotonic()) is the request's deadline and bounds the
+        whole call, queueing included; the POST gets the role's timeout or
+        whatever is left, if less.
+        """
+        url = f"http://127.0.0.1:{port}/completion"
+        timeout = timeout or ROLE_TIMEOUTS.get(role, 60)
+        with TRACER.span(f"llm:{role}", port=port, n_predict=payload.get("n_predict"),
+                         prompt_chars=len(payload.get("prompt") or "")) as span:
+            async with self._admit(role, port, timeout, payload.get("id_slot"), expires) as slot_id:
+                span["timeout_s"] = round(_time_left(timeout, expires), 2)
+                t = aiohttp.ClientTimeout(total=span["timeout_s"])
+                try:
+                    async with self.session(port).post(url, json={**payload, "id_slot": slot_id}, timeout=t) as r:
+                        r.raise_for_status()
+                        data = await r.json()
+                        self._record_usage(port, data)
+                        return data
+                except Exception:
+                    self.stats["errors"] += 1
+                    raise
+
+    async def stream_completion(self, role: str, port: int, payload: dict, timeout: float | None = None,
+                                expires: float | None = None):
+        """
+        POST a /completion request with stream=True and yield each decoded
+        server-sent chunk ({"content": ..., "stop": ...}) as it arrives.
+        id_slot, timeout and expires work as in completion().
+        """
+        url = f"http://127.0.0.1:{port}/completion"
+        timeout = timeout or ROLE_TIMEOUTS.get(role, 60)
+        async with self._admit(role, port, timeout, payload.get("id_slot"), expires) as slot_id:
+            left = _time_left(timeout, expires)
+            TRACER.annotate(timeout_s=round(left, 2))
+            t = aiohttp.ClientTimeout(total=left)
+            try:
+                async with self.session(port).post(url, json={**payload, "id_slot": slot_id, "stream": True}, timeout=t) as r:
+                    r.raise_for_status()
+                    async for raw in r.content:
+                        line = raw.decode("utf-8", errors="ignore").strip()
+                        if not line.startswith("data:"):
+                            continue
+                        chunk = json.loads(line[5:].strip())
+                        if chunk.get("stop"):
+                            self._record_usage(port, chunk)
+                        yield chunk
+                        if chunk.get("stop"):
+                            break
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+
+    def snapshot(self) -> dict:
+        total = self.stats["new_connections"] + self.stats["reused_connections"]
+        reuse = self.stats["reused_connections"] / total if total else 0.0
+        ports = {}
+        for p, h in self.port_waits.items():
+            slots = self.port_limits.get(p, DEFAULT_PORT_SLOTS)
+            free = self._port_sems[p][1] if p in self._port_sems else ()
+            ports[p] = {"slots": slots, "busy": slots - len(free), "waiting": self.port_waiting.get(p, 0),
+                        "dispatched": self.slot_dispatch.get(p, {}), "queue_wait": h.snapshot()}
+        return {**self.stats, "reuse_ratio": round(reuse, 3),
+                "open_pools": sorted(p for p, s in self._sessions.items() if not s.closed), "ports": ports,
+                "tokens": self.usage}
+
+    async def close(self):
+        for sess in self._sessions.values():
+            if not sess.closed:
+                await sess.close()
+        self._sessions.clear()
+
+_client: LlamaHTTP | None = None
+
+def get_client() -> LlamaHTTP:
+    """Return the shared client, creating it lazily when used outside the app."""
+    global _client
+    if _client is None:
+        _client = LlamaHTTP()
+    return _client
+
+async def stream_text(role: str, port: int, payload: dict, on_token, timeout: float | None = None,
+                      expires: float | None = None) -> str:
+    """Stream a completion into on_token(piece) and return the full stripped text."""
+    parts = []
+    t0 = time.perf_counter()
+    with TRACER.span(f"llm:{role}", port=port, stream=True, n_predict=payload.get("n_predict"),
+                     prompt_chars=len(payload.get("prompt") or "")) as span:
+        async for chunk in get_client().stream_completion(role, port, payload, timeout, expires):
+            piece = chunk.get("content") or ""
+            if piece:
+                if not parts:
+                    span["first_token_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+                parts.append(piece)
+                await on_token(piece)
+    return "".join(parts).strip()
+
+async def on_startup(app):
+    app["llama_http"] = get_client()
+
+async def on_cleanup(app):
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import os, time, asyncio
+from collections import OrderedDict
+from answer_cache import normalize
+import resource_controller
+
+IDLE_LEARNING = os.environ.get("ULTRA_AI_IDLE_LEARNING", "1") != "0"
+IDLE_QUEUE_MAX = int(os.environ.get("ULTRA_AI_IDLE_QUEUE", "64"))
+IDLE_QUIET_S = float(os.environ.get("ULTRA_AI_IDLE_QUIET", "30"))  # no requests for this long before working
+IDLE_INTERVAL_S = 5.0
+IDLE_ATTEMPTS = 2
+
+class IdleLearner:
+    """
+    Background "idle learning". Queries the pipeline could not answer well
+    are queued (oldest first, bounded) and, once the device is idle (no
+    requests admitted or waiting, none for quiet_s, and
+    resource_controller.device_idle()), handed one at a time to worker, set
+    by the orchestrator, which answers them properly and stores the result
+    so a repeat is served from the cache/KB.
+
+    A request arriving cancels the job in progress at once; the query goes
+    back to the front of the queue and is retried at the next idle period.
+    """
+    def __init__(self, scheduler, max_items=IDLE_QUEUE_MAX, quiet_s=IDLE_QUIET_S, interval=IDLE_INTERVAL_S):
+        self.scheduler = scheduler
+        self.max_items = max_items
+        self.quiet_s = quiet_s
+        self.interval = interval
+        self.items = OrderedDict()      # normalized text -> {"text", "domain", "reason", "attempts", "added"}
+        self.worker = None              # async fn(item) -> True once an answer was stored
+        self.last_request = time.monotonic()
+        self.current = None             # (key, item, task) of the job in progress
+        self._task = None
+        self.stats = {"queued": 0, "dropped": 0, "learned": 0, "failed": 0, "interrupted": 0}
+
+    def note(self, text: str, domain=None, reason: str = ""):
+        """Queue text for idle learning; a query already queued keeps its place."""
+        key = normalize(text)
+        if not key or (self.current and self.current[0] == key):
+            return
+        if key in self.items:
+            self.items[key]["reason"] = reason
+            return
+        self.items[key] = {"text": text, "domain": domain, "reason": reason, "attempts": 0, "added": time.time()}
+        self.stats["queued"] += 1
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+            self.stats["dropped"] += 1
+
+    def forget(self, text: str):
+        """Drop text from the queue, e.g. after a request answered it properly."""
+        self.items.pop(normalize(text), None)
+
+    def touch(self):
+        """A user request arrived: stop background work so it gets the models."""
+        self.last_request = time.monotonic()
+        if self.current and not self.current[2].done():
+            self.current[2].cancel()
+
+    def idle(self) -> bool:
+        if self.scheduler.active or self.scheduler.waiting:
+            return False
+        return time.monotonic() - self.last_request >= self.quiet_s and resource_controller.device_idle()
+
+    async def _learn_next(self):
+        key, item = self.items.popitem(last=False)
+        task = asyncio.ensure_future(self.worker(item))
+        self.current = (key, item, task)
+        try:
+            await asyncio.wait({task})
+        finally:
+            self.current = None
+        if task.cancelled():
+            self.stats["interrupted"] += 1
+            if key not in self.items:
+                self.items[key] = item
+                self.items.move_to_end(key, last=False)
+            return
+        try:
+            learned = task.result()
+        except Exception as e:
+            print(f"Idle learning error: {e}")
+            learned = False
+        if learned:
+            self.stats["learned"] += 1
+            return
+        item["attempts"] += 1
+        if item["attempts"] < IDLE_ATTEMPTS and key not in self.items:
+            self.items[key] = item
+        else:
+            self.stats["failed"] += 1
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.items and self.worker and self.idle():
+                await self._learn_next()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.current:
+            self.current[2].cancel()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "queue": len(self.items), "running": self.current[1]["text"] if self.current else None,
+                "idle": self.idle(), "quiet_s": self.quiet_s,
+                "oldest": [{"text": i["text"], "reason": i["reason"], "attempts": i["attempts"]}
+                           for i in list(self.items.values())[:10]]}
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+import re, math, time, sqlite3, threading
+from collections import Counter
+from pathlib import Path
+
+STOPWORDS = set("""
+a an the and or but if of to in on at by for with from as is are was were be been being
+do does did what which who whom whose when where why how this that these those it its
+i you he she we they me my your our their can could should would will shall may might
+please tell about explain give me some any into than then there here yes so
+whats hows whos wheres whens whys im
+""".split())
+
+K1 = 1.2
+B = 0.75
+QUESTION_WEIGHT = 2     # question terms count double against answer terms
+
+def tokenize(text: str) -> list[str]:
+    words = (w.strip(".") for w in re.findall(r"[a-z0-9_+#.]+", (text or "").lower().replace("'", "")))
+    return [w for w in words if w and w not in STOPWORDS]
+
+def normalize_key(text: str) -> str:
+    """Question terms in order, so "fahrenheit to celsius" and "celsius to fahrenheit" stay apart."""
+    return " ".join(tokenize(text))
+
+class KnowledgeBase:
+    """
+    Local retrieval store: SQLite documents plus a BM25 inverted index kept
+    up to date incrementally on every add. A stored answer is reused as is
+    only for the same normalized question (lookup); BM25 matches are merely
+    related notes for the Librarian (search).
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                key TEXT UNIQUE,
+                question TEXT,
+                answer TEXT,
+                source TEXT,
+                length INTEGER,
+                updated REAL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT,
+                doc_id INTEGER,
+                tf INTEGER,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+        """)
+        self.db.commit()
+        n, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+        self.n_docs, self.total_len = n, total
+        self.stats = {"lookups": 0, "hits": 0, "adds": 0}
+
+    def _terms(self, question, answer):
+        tf = Counter()
+        for t in tokenize(question):
+            tf[t] += QUESTION_WEIGHT
+        for t in tokenize(answer):
+            tf[t] += 1
+        return tf
+
+    def add(self, question: str, answer: str, source: str = "librarian"):
+        """Insert or replace the answer for a question and reindex it."""
+        key = normalize_key(question)
+        if not key or not answer:
+            return
+        tf = self._terms(question, answer)
+        length = sum(tf.values())
+        with self._lock:
+            row = self.db.execute("SELECT id, length FROM docs WHERE key=?", (key,)).fetchone()
+            if row:
+                doc_id, old_len = row
+                self.db.execute("DELETE FROM postings WHERE doc_id=?", (doc_id,))
+                self.db.execute("UPDATE docs SET question=?, answer=?, source=?, length=?, updated=? WHERE id=?",
+                                (question, answer, source, length, time.time(), doc_id))
+                self.total_len += length - old_len
+            else:
+                cur = self.db.execute("INSERT INTO docs (key, question, answer, source, length, updated) VALUES (?,?,?,?,?,?)",
+                                      (key, question, answer, source, length, time.time()))
+                doc_id = cur.lastrowid
+                self.n_docs += 1
+                self.total_len += length
+            self.db.executemany("INSERT INTO postings (term, doc_id, tf) VALUES (?,?,?)",
+                                [(t, doc_id, n) for t, n in tf.items()])
+            self.db.commit()
+            self.stats["adds"] += 1
+
+    def search(self, query: str, k: int = 3) -> list[dict]:
+        """Return up to k documents ranked by BM25 score."""
+        terms = set(tokenize(query))
+        if not terms or not self.n_docs:
+            return []
+        avg_len = self.total_len / self.n_docs
+        scores = Counter()
+        with self._lock:
+            for term in terms:
+                rows = self.db.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc_id WHERE p.term=?",
+                    (term,)).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (self.n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+                for doc_id, tf, length in rows:
+                    scores[doc_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_len))
+            out = []
+            for doc_id, score in scores.most_common(k):
+                q, a, src = self.db.execute("SELECT question, answer, source FROM docs WHERE id=?", (doc_id,)).fetchone()
+                out.append({"question": q, "answer": a, "source": src, "score": round(score, 3)})
+        return out
+
+    def lookup(self, query: str):
+        """Stored answer for the same question (same terms in the same order), else None."""
+        self.stats["lookups"] += 1
+        key = normalize_key(query)
+        if not key:
+            return None
+        with self._lock:
+            row = self.db.execute("SELECT question, answer, source FROM docs WHERE key=?", (key,)).fetchone()
+        # Rows keyed before negations counted as terms may share a key with a different question
+        if not row or normalize_key(row[0]) != key:
+            return None
+        self.stats["hits"] += 1
+        return {"question": row[0], "answer": row[1], "source": row[2]}
+
+    def all(self) -> dict:
+        with self._lock:
+            return {q: a for q, a in self.db.execute("SELECT question, answer FROM docs ORDER BY id")}
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "docs": self.n_docs}
@@ -1,39 +1,90 @@
 #!/usr/bin/env python3
-import json, aiohttp, asyncio
+import json, math, asyncio
 from pathlib import Path
+from http_client import get_client, stream_text
+from kb import KnowledgeBase
 
 KB_DIR = Path(__file__).resolve().parent.parent / "data"
 KB_DIR.mkdir(parents=True, exist_ok=True)
-KB_FILE = KB_DIR / "kb.json"
+KB_FILE = KB_DIR / "kb.json"            # legacy store, imported once
+KB_DB = KB_DIR / "kb.sqlite3"
+
+_kb = None
+
+def get_kb() -> KnowledgeBase:
+    global _kb
+    if _kb is None:
+        _kb = KnowledgeBase(KB_DB)
+        if KB_FILE.exists() and not _kb.n_docs:
+            try:
+                for q, a in json.loads(KB_FILE.read_text(encoding="utf-8")).items():
+                    _kb.add(q, a if isinstance(a, str) else json.dumps(a, ensure_ascii=False), source="kb.json")
+            except Exception as e:
+                print(f"KB import error: {e}")
+    return _kb
 
 def load_kb():
-    if KB_FILE.exists():
-        try:
-            return json.loads(KB_FILE.read_text(encoding="utf-8"))
-        except Exception:
-            return {}
-    return {}
+    return get_kb().all()
 
 def save_kb(kb):
-    KB_FILE.write_text(json.dumps(kb, ensure_ascii=False, indent=2), encoding="utf-8")
+    """Upsert question -> answer pairs; only changed entries are reindexed."""
+    store = get_kb()
+    current = store.all()
+    for q, a in kb.items():
+        if current.get(q) != a:
+            store.add(q, a)
 
-async def librarian_lookup(port: int, query: str, n_predict: int = 128):
+async def librarian_lookup(port: int, query: str, n_predict: int = 128, on_token=None, prompt: str | None = None, slot=None, expires=None):
     """
     Ask the Librarian model for a concise answer or search result.
     """
-    url = f"http://127.0.0.1:{port}/completion"
     payload = {
-        "prompt": f"Answer concisely:\n{query}\n",
+        "prompt": prompt or f"Answer concisely:\n{query}\n",
         "n_predict": n_predict,
-        "temperature": 0.3
+        "temperature": 0.3,
+        "cache_prompt": True
     }
+    if slot is not None:
+        payload["id_slot"] = slot
     try:
-        async with aiohttp.ClientSession() as sess:
-            async with sess.post(url, json=payload, timeout=25) as r:
-                r.raise_for_status()
-                data = await r.json()
-                text = data.get("content") or data.get("text") or ""
-                return text.strip()
+        if on_token is None:
+            data = await get_client().completion("librarian", port, payload, expires=expires)
+            text = data.get("content") or data.get("text") or ""
+            return text.strip()
+        return await stream_text("librarian", port, payload, on_token, expires=expires)
     except Exception as e:
         print(f"Librarian error: {e}")
         return ""
+
+def _token_probs(data: dict) -> list[float]:
+    """Chosen-token probabilities from llama.cpp's completion_probabilities (old and new formats)."""
+    probs = []
+    for entry in data.get("completion_probabilities") or []:
+        if "logprob" in entry:
+            probs.append(math.exp(entry["logprob"]))
+            continue
+        top = entry.get("probs") or []
+        match = next((p for p in top if p.get("tok_str") == entry.get("content")), top[0] if top else None)
+        if match:
+            probs.append(float(match.get("prob", 0.0)))
+    return probs
+
+async def librarian_probe(port: int, prompt: str, n_predict: int = 6) -> float | None:
+    """
+    Greedy-decode a few tokens with n_probs and return their mean probability,
+    a cheap confidence signal for the query; None if the probe failed.
+    """
+    payload = {
+        "prompt": prompt,
+        "n_predict": n_predict,
+        "temperature": 0,
+        "n_probs": 1,
+        "cache_prompt": True
+    }
+    try:
+        data = await get_client().completion("librarian", port, payload, timeout=5)
+    except Exception as e:
+        print(f"Librarian probe error: {e}")
+        return None
+    probs = _token_probs(data)
+    return sum(probs) / len(probs) if probs else None
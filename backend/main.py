@@ -1,95 +1,617 @@
 #!/usr/bin/env python3
-import os, json, asyncio
+import os, json, time, asyncio
 from pathlib import Path
 from aiohttp import web
-from resource_controller import load_models, ensure_specialist_running, cleanup_after_specialist
+import resource_controller
+from registry import REGISTRY
+from process_manager import PROCESSES
+from footprint import ESTIMATOR
+from sessions import SessionStore, count_tokens
+from coalesce import SingleFlight
+from budget import Deadline, MIN_STAGE_S, MAX_DEADLINE_S, n_predict_for, stage_seconds, fit_prompt
+from idle_learner import IdleLearner, IDLE_LEARNING
 from gatekeeper import gatekeeper_answer
-from librarian import librarian_lookup
+from librarian import librarian_lookup, get_kb, KB_DIR
 from specialist import pick_specialist, call_specialist
+from specialist_pool import SpecialistPool
+from supervisor import SUPERVISOR
+from answer_cache import AnswerCache, normalize
+from metrics import METRICS
+from tracing import TRACER
+from scheduler import Scheduler
+from router import Router
+import http_client
 
 ROOT = Path(__file__).resolve().parent
-MODELS = load_models()
+POOL = SpecialistPool()
+SCHEDULER = Scheduler(POOL)
+ROUTER = Router()
+ROUTING = os.environ.get("ULTRA_AI_ROUTER", "1") != "0"
+SPECULATIVE_DEFAULT = os.environ.get("ULTRA_AI_SPECULATIVE", "0") == "1"
+SKIP_REFINE_QUALITY = float(os.environ.get("ULTRA_AI_SKIP_REFINE_QUALITY", "0.7"))
+HEDGES = ("lowconf", "i'm not sure", "i am not sure", "i don't know", "i do not know",
+          "cannot answer", "can't answer", "not certain", "no information")
+# Each role's prompts start with the same fixed header so llama.cpp's prompt
+# cache (cache_prompt) can reuse those tokens across tasks and requests; the
+# per-request text always comes last. Session history sits right after the
+# header so it stays a cached prefix from one turn to the next.
+GK_PREFIX = ("You are Ultra AI's Gatekeeper, a careful on-device assistant. "
+             "Be accurate and concise. Never invent facts.\n\n")
+LIB_PREFIX = "You are Ultra AI's Librarian. Give short, factual research notes.\n\n"
+SPEC_PREFIX = "You are an expert specialist model. Work carefully and explain precisely.\n\n"
+PROMPTS = {
+    "gatekeeper": GK_PREFIX + "{history}Task: answer if certain; else say 'LOWCONF'.\nUser: {text}\nAnswer:",
+    "answer": GK_PREFIX + "{history}Task: answer the user.\nUser: {text}\nAnswer:",
+    "refine": GK_PREFIX + "{history}Task: refine this answer with better clarity.\nUser: {text}\nLibrarian notes: {notes}\nAnswer:",
+    "fallback": GK_PREFIX + "{history}Task: provide best-effort general guidance.\nUser: {text}\nAnswer:",
+    "polish": GK_PREFIX + "Task: rephrase for clarity and completeness.\nDraft: {draft}\nAnswer:",
+    "librarian": LIB_PREFIX + "{history}{notes}Answer concisely:\n{text}\n",
+    "specialist": SPEC_PREFIX + "{history}User question:\n{text}\nPlease produce a precise, helpful answer.",
+    "summary": LIB_PREFIX + "Summarize this conversation in a few short sentences, keeping names, facts and decisions:\n{text}\nSummary:",
+}
+OUT_OF_TIME = "Ran out of time before finding a confident answer."
+KB_NOTES = 2                # related KB entries given to the Librarian as notes
+SESSIONS = SessionStore()
+FLIGHTS = SingleFlight()
+LEARNER = IdleLearner(SCHEDULER)
+CACHE = AnswerCache(path=KB_DIR / "answer_cache.jsonl" if os.environ.get("ULTRA_AI_CACHE_PERSIST", "1") != "0" else None)
 
 def get_port(role_or_name):
-    for m in MODELS:
-        if m.get("role") == role_or_name or m.get("name") == role_or_name:
-            return m.get("port")
-    return None
+    m = REGISTRY.resolve(role_or_name)
+    return m.get("port") if m else None
 
-async def api_handler(request: web.Request) -> web.Response:
+def pipeline_key(text: str, dive_confirmed: bool, domain_hint) -> str:
+    gk_model = REGISTRY.resolve("gatekeeper") or {}
+    return CACHE.key(text, "pipeline", gk_model.get("name"), {"dive": dive_confirmed, "domain": domain_hint})
+
+def remember(text: str, dive_confirmed: bool, domain_hint, result: dict):
+    """Store a pipeline answer in the cache, and in the KB if the Librarian or a Specialist produced it."""
+    CACHE.put(pipeline_key(text, dive_confirmed, domain_hint), result)
+    if result.get("source") in ("librarian", "specialist"):
+        get_kb().add(text, result["answer"], source=result["source"])
+
+def kb_notes(text: str) -> str:
+    """Related KB entries (BM25), formatted as notes for the Librarian prompt."""
+    docs = get_kb().search(text, k=KB_NOTES)
+    if not docs:
+        return ""
+    return "Related notes:\n" + "".join(f"Q: {d['question']}\nA: {d['answer']}\n" for d in docs) + "\n"
+
+def answer_quality(text: str) -> float:
+    """
+    Cheap 0..1 score for a draft answer: enough substance, no hedging, and a
+    finished last sentence. Used to decide whether a refine pass is worth it.
+    """
+    if not text:
+        return 0.0
+    lower = text.lower()
+    if any(h in lower for h in HEDGES):
+        return 0.0
+    score = min(len(text) / 200, 1.0) * 0.7
+    if text.rstrip().endswith((".", "!", "?", "`", ")")):
+        score += 0.3
+    return round(score, 3)
+
+async def read_request(request: web.Request) -> dict:
     try:
-        data = await request.json()
+        return await request.json()
     except:
         body = await request.text()
-        data = {"text": body}
+        return {"text": body}
+
+async def summarize_history(text: str) -> str:
+    lib_port = get_port("librarian")
+    if not lib_port:
+        return ""
+    return await librarian_lookup(lib_port, text, prompt=PROMPTS["summary"].format(text=text))
+
+SESSIONS.summarizer = summarize_history
+
+async def learn(item: dict) -> bool:
+    """Idle-learning job: dive into a queued query and store the answer for the next time it is asked."""
+    text, domain_hint = item["text"], item.get("domain")
+    with TRACER.trace("idle_learn", reason=item.get("reason"), attempts=item.get("attempts")) as trace:
+        result = await run_pipeline(text, True, domain_hint, deadline=Deadline(MAX_DEADLINE_S), background=True)
+        trace.attrs.update(result_attrs(result))
+    if result.get("status") != "ok" or result.get("source") == "fallback" or result.get("deadline_limited"):
+        return False
+    # Serve it for the plain question as well as for a confirmed dive
+    remember(text, False, domain_hint, result)
+    CACHE.put(pipeline_key(text, True, domain_hint), result)
+    METRICS.incr("idle_learned")
+    return True
+
+LEARNER.worker = learn
+
+async def orchestrate(data: dict, emit=None) -> dict:
+    """
+    Answer one request, from the answer cache when possible, otherwise by
+    running the model pipeline. With emit, stage markers and tokens are sent
+    to it as they are produced: {"type": "stage"|"token"|"discard", "stage": ...}.
+
+    A request carrying a "session_id" key (null starts a new session) is
+    answered with that session's history and the turn is recorded; the
+    response echoes the session_id to send with the next turn.
+
+    Identical concurrent requests (same normalized text and flags, no
+    session history) share one pipeline run; followers get the leader's
+    events and result, but never wait past their own deadline, and a
+    request with clearly more time than the running one gets its own run.
+
+    "deadline_s" bounds the whole request (ULTRA_AI_DEADLINE by default);
+    every model call gets the remaining time as its timeout.
+    """
+    LEARNER.touch()
+    # Domain names are strings; anything else (e.g. a JSON list) is no hint
+    domain = data.get("domain")
+    data = {**data, "domain": (domain.strip() or None) if isinstance(domain, str) else None}
+    deadline = Deadline(data.get("deadline_s"))
+    session = SESSIONS.get(data.get("session_id")) if "session_id" in data else None
+    if session and session.turns:
+        result = await answer_request(data, emit, session, deadline)
+    else:
+        key = (normalize(data.get("text") or ""), bool(data.get("dive_confirmed", False)), data.get("domain"),
+               bool(data.get("speculative", SPECULATIVE_DEFAULT or data.get("mode") == "aggressive")))
+        try:
+            result = await FLIGHTS.run(key, lambda flight_emit: answer_request(data, flight_emit, deadline=deadline),
+                                       emit, expires=deadline.expires)
+        except asyncio.TimeoutError:
+            # Joined a run that outlasted this request's own deadline
+            METRICS.incr("deadline_exceeded:coalesced")
+            result = {"status": "error", "message": OUT_OF_TIME, "stage": "coalesced"}
+        if result.get("coalesced"):
+            METRICS.incr("coalesced")
+    if session is None:
+        return result
+    if result.get("status") == "ok" and result.get("answer"):
+        SESSIONS.append(session, (data.get("text") or "").strip(), result["answer"])
+    return {**result, "session_id": session.id}
 
+async def answer_request(data: dict, emit=None, session=None, deadline=None) -> dict:
     text = (data.get("text") or "").strip()
     dive_confirmed = bool(data.get("dive_confirmed", False))
     domain_hint = data.get("domain")  # optional
 
     if not text:
-        return web.json_response({"status": "error", "message": "empty input"})
+        return {"status": "error", "message": "empty input"}
+
+    # Follow-ups depend on the conversation, so cached and KB answers only
+    # apply to a session's first turn
+    contextual = bool(session and session.turns)
+    key = pipeline_key(text, dive_confirmed, domain_hint)
+    cached = None if contextual else CACHE.get(key)
+    if cached:
+        if emit:
+            await emit({"type": "stage", "stage": "cache"})
+            await emit({"type": "token", "stage": "cache", "text": cached.get("answer", "")})
+        return {**cached, "cached": True}
+
+    known = None if contextual else get_kb().lookup(text)
+    # A confirmed dive only accepts answers a specialist already produced
+    if known and (not dive_confirmed or known["source"] == "specialist"):
+        if emit:
+            await emit({"type": "stage", "stage": "kb"})
+            await emit({"type": "token", "stage": "kb", "text": known["answer"]})
+        result = {"status": "ok", "answer": known["answer"], "source": "kb"}
+        CACHE.put(key, result)
+        return result
+
+    # The web UI's "Aggressive" mode opts into speculative fan-out
+    speculative = bool(data.get("speculative", SPECULATIVE_DEFAULT or data.get("mode") == "aggressive"))
+    mode = "speculative" if speculative else "sequential"
+    t0 = time.perf_counter()
+    result = await run_pipeline(text, dive_confirmed, domain_hint, emit, speculative=speculative,
+                                session=session, deadline=deadline)
+    # Per-mode latency, overall and per answering path, to compare the modes
+    ms = (time.perf_counter() - t0) * 1000
+    METRICS.observe(f"mode:{mode}", ms)
+    METRICS.observe(f"mode:{mode}:{result.get('source') or result.get('status')}", ms)
+    # A follow-up's answer depends on the conversation, so it is neither
+    # stored nor learned: idle learning answers without the history and its
+    # result would be served to everyone asking the bare question
+    if contextual:
+        return result
+    cacheable = result.get("source") != "fallback" and not result.get("deadline_limited")
+    if result.get("status") == "ok" and cacheable:
+        remember(text, dive_confirmed, domain_hint, result)
+        LEARNER.forget(text)
+    elif IDLE_LEARNING and (result.get("status") != "error" or result.get("stage")):
+        # Low-confidence, fallback and out-of-time answers are retried while the device is idle
+        LEARNER.note(text, domain_hint, reason=result.get("source") or result.get("stage") or result.get("status"))
+    return result
+
+async def run_pipeline(text: str, dive_confirmed: bool, domain_hint, emit=None, speculative=False, session=None,
+                       deadline=None, background=False) -> dict:
+    """
+    Run the Gatekeeper → Librarian → Specialist pipeline and return the
+    response body; "source" names the stage whose answer was used.
+
+    The router picks the domain (when none was given) and, when it is
+    confident, either lets the Gatekeeper answer without the LOWCONF probe
+    or skips the Gatekeeper pass and goes straight to the Librarian, whose
+    prompt carries the closest KB entries (BM25) as related notes.
+
+    In speculative mode the Librarian lookup runs alongside the first
+    Gatekeeper pass and is cancelled if the Gatekeeper answers confidently;
+    the refine pass is skipped when the Librarian draft scores at least
+    SKIP_REFINE_QUALITY.
+
+    With a session, prompts carry its history and run in the session's
+    pinned slot so the cached conversation prefix is reused; a follow-up is
+    routed on the user's recent questions as well as its own text.
+
+    Every stage runs within deadline: model calls time out with the request,
+    n_predict shrinks to what the model can decode in the time left, the
+    optional refine and polish passes are skipped when they would not fit,
+    and prompts are trimmed to each model's context. Answers shaped by the
+    deadline carry "deadline_limited": True and are not cached.
+
+    background runs (idle learning) only use specialists that are resident
+    or fit without pausing the Gatekeeper/Librarian.
+    """
+    deadline = deadline or Deadline()
+    client = http_client.get_client()
+    limited = []        # stages the deadline cut short or skipped
+    capped = {}         # prompt name -> n_predict lowered by the deadline
+
+    async def stage(name):
+        if emit:
+            await emit({"type": "stage", "stage": name})
+
+    async def discard(name):
+        if emit:
+            await emit({"type": "discard", "stage": name})
+
+    history = session.history() if session else ""
+
+    def slot(port):
+        if session is None or not port:
+            return None
+        return SESSIONS.slot_for(session, port, client.port_limits.get(port, 1))
+
+    def tokens(name):
+        if not emit:
+            return None
+        async def on_token(piece):
+            await emit({"type": "token", "stage": name, "text": piece})
+        return on_token
+
+    def budget(port, name, n_predict, **fields):
+        """Prompt fitted to port's context window and n_predict capped by the deadline."""
+        n = n_predict_for(deadline, n_predict, client.decode_rate(port))
+        if n < n_predict:
+            capped[name] = n
+        n_ctx = int((REGISTRY.port(port) or {}).get("context", 4096))
+        return fit_prompt(PROMPTS[name], n_ctx, n, history=history, **fields), n
+
+    def spent(name, answer):
+        """Note when an answer probably ran into its deadline-capped n_predict."""
+        if name in capped and count_tokens(answer or "") >= capped[name] * 0.8:
+            limited.append(name)
+        return answer
+
+    def fits(port, n_predict):
+        return deadline.allows(stage_seconds(n_predict, client.decode_rate(port)))
+
+    def done(result):
+        return {**result, "deadline_limited": True} if limited else result
+
+    def out_of_time(name):
+        METRICS.incr(f"deadline_exceeded:{name}")
+        return {"status": "error", "message": OUT_OF_TIME, "stage": name}
 
     # 1) Gatekeeper first pass
     gk_port = get_port("gatekeeper")
     lib_port = get_port("librarian")
 
     if not gk_port:
-        return web.json_response({"status": "error", "message": "gatekeeper not configured"})
+        return {"status": "error", "message": "gatekeeper not configured"}
+
+    route = {"domain": None, "decision": "probe"}
+    if ROUTING:
+        async with METRICS.timed("route"):
+            # A follow-up ("what about its population") is routed by the topic before it
+            route_text = f"{session.recent_questions()}\n{text}" if session and session.turns else text
+            route = await ROUTER.route(route_text, lib_port, PROMPTS["librarian"].format(text=text, notes="", history=history))
+        METRICS.incr(f"route:{route['decision']}")
+    domain_hint = domain_hint or route["domain"]
+    escalate = route["decision"] == "escalate" and bool(lib_port)
+
+    lib_task = None
+    notes = kb_notes(text) if lib_port else ""
+    # The speculative Librarian lookup holds a Librarian slot, so every exit
+    # (early return, error, client disconnect) cancels it unless it finished
+    try:
+        if speculative and lib_port and not escalate:
+            prompt, n = budget(lib_port, "librarian", 128, text=text, notes=notes)
+            lib_task = asyncio.ensure_future(librarian_lookup(lib_port, text, n_predict=n, prompt=prompt, slot=slot(lib_port),
+                                                              expires=deadline.expires))
+
+        if not escalate:
+            if not deadline.allows(MIN_STAGE_S):
+                return out_of_time("gatekeeper")
+            await stage("gatekeeper")
+            prompt_name = "answer" if route["decision"] == "answer" else "gatekeeper"
+            prompt, n = budget(gk_port, prompt_name, 256, text=text)
+            async with METRICS.timed("gatekeeper"):
+                gk_ans = spent(prompt_name, await gatekeeper_answer(gk_port, prompt, n_predict=n, on_token=tokens("gatekeeper"), slot=slot(gk_port),
+                                                                    expires=deadline.expires))
+            if gk_ans and "LOWCONF" not in gk_ans and len(gk_ans) > 20:
+                if lib_task and not lib_task.done():
+                    METRICS.incr("speculative_librarian_cancelled")
+                return done({"status": "ok", "answer": gk_ans, "source": "gatekeeper"})
+            await discard("gatekeeper")
 
-    gk_ans = await gatekeeper_answer(gk_port, f"Answer if certain; else say 'LOWCONF':\n{text}")
-    if gk_ans and "LOWCONF" not in gk_ans and len(gk_ans) > 20:
-        return web.json_response({"status": "ok", "answer": gk_ans})
+        # 2) Librarian fallback
+        if lib_port:
+            if lib_task is None and not deadline.allows(MIN_STAGE_S):
+                return out_of_time("librarian")
+            await stage("librarian")
+            async with METRICS.timed("librarian"):
+                if lib_task:
+                    lib_ans = spent("librarian", await lib_task)
+                    if lib_ans and emit:
+                        await tokens("librarian")(lib_ans)
+                else:
+                    prompt, n = budget(lib_port, "librarian", 128, text=text, notes=notes)
+                    lib_ans = spent("librarian", await librarian_lookup(lib_port, text, n_predict=n, prompt=prompt, on_token=tokens("librarian"), slot=slot(lib_port),
+                                                                        expires=deadline.expires))
+    finally:
+        if lib_task and not lib_task.done():
+            lib_task.cancel()
 
-    # 2) Librarian fallback
     if lib_port:
-        lib_ans = await librarian_lookup(lib_port, text)
+        if lib_task and len(lib_ans or "") > 20 and answer_quality(lib_ans) >= SKIP_REFINE_QUALITY:
+            METRICS.incr("speculative_refine_skipped")
+            return done({"status": "ok", "answer": lib_ans, "source": "librarian"})
         if lib_ans and len(lib_ans) > 20:
-            gk_refined = await gatekeeper_answer(
-                gk_port,
-                f"Refine this answer with better clarity:\nUser: {text}\nLibrarian notes: {lib_ans}"
-            )
+            # Refine is optional: the Librarian notes stand on their own
+            if not fits(gk_port, 256):
+                METRICS.incr("deadline_skipped:refine")
+                limited.append("refine")
+                return done({"status": "ok", "answer": lib_ans, "source": "librarian"})
+            await stage("refine")
+            prompt, n = budget(gk_port, "refine", 256, text=text, notes=lib_ans)
+            async with METRICS.timed("refine"):
+                gk_refined = spent("refine", await gatekeeper_answer(gk_port, prompt, n_predict=n, on_token=tokens("refine"), slot=slot(gk_port),
+                                                                     expires=deadline.expires))
             if gk_refined and len(gk_refined) > 20:
-                return web.json_response({"status": "ok", "answer": gk_refined})
-            return web.json_response({"status": "ok", "answer": lib_ans})
+                return done({"status": "ok", "answer": gk_refined, "source": "librarian"})
+            return done({"status": "ok", "answer": lib_ans, "source": "librarian"})
+        await discard("librarian")
 
     # 3) Not confident → offer Dive Deeper
     if not dive_confirmed:
-        return web.json_response({
+        return {
             "status": "needs_deeper",
             "prompt": "I'm unable to provide a complete answer right now. Would you like me to dive deeper? This may take a moment."
-        })
+        }
+
+    async def fallback(message):
+        if deadline.allows(MIN_STAGE_S):
+            await stage("fallback")
+            prompt, n = budget(gk_port, "fallback", 256, text=text)
+            answer = spent("fallback", await gatekeeper_answer(gk_port, prompt, n_predict=n, on_token=tokens("fallback"), slot=slot(gk_port),
+                                                               expires=deadline.expires))
+        else:
+            answer = ""
+        return done({"status": "ok", "answer": answer or message, "source": "fallback"})
 
     # 4) Specialist flow
+    if not deadline.allows(MIN_STAGE_S):
+        return out_of_time("specialist_start")
+    await stage("specialist_start")
     pref = pick_specialist(domain_hint)
-    ok, used, notes = ensure_specialist_running(pref["name"] if pref else None, domain=domain_hint)
+    try:
+        async with METRICS.timed("specialist_start"):
+            ok, used, notes = await asyncio.wait_for(
+                SCHEDULER.acquire_specialist(pref["name"] if pref else None, domain=domain_hint, background=background),
+                deadline.remaining())
+    except asyncio.TimeoutError:
+        # The cold start carries on for other waiters; this request has no time left for it
+        METRICS.incr("deadline_exceeded:specialist_start")
+        ok = False
     if not ok:
-        fallback = await gatekeeper_answer(gk_port, f"Provide best-effort general guidance:\n{text}")
-        return web.json_response({
-            "status": "ok",
-            "answer": fallback or "I can't go deeper right now. I'll keep improving this topic during idle learning."
-        })
+        return await fallback("I can't go deeper right now. I'll keep improving this topic during idle learning.")
 
-    used_model = next((m for m in MODELS if m.get("name") == used), pref)
-    if not used_model:
-        fallback = await gatekeeper_answer(gk_port, f"Provide best-effort general guidance:\n{text}")
-        return web.json_response({"status": "ok", "answer": fallback or "No specialist available"})
+    used_model = REGISTRY.get(used) or pref
+    if not used_model or not deadline.allows(MIN_STAGE_S):
+        await SCHEDULER.release_specialist(used)
+        return await fallback("No specialist available")
 
-    # Call specialist
-    spec_prompt = f"User question:\n{text}\nPlease produce a precise, helpful answer."
-    spec_ans = await call_specialist(used_model, spec_prompt)
+    # Call specialist; it stays pinned (never evicted) until released
+    try:
+        await stage("specialist")
+        spec_prompt, n = budget(used_model["port"], "specialist", 512, text=text)
+        async with METRICS.timed("specialist_call"):
+            spec_ans = spent("specialist", await call_specialist(used_model, spec_prompt, n_predict=n, on_token=tokens("specialist"),
+                                                                 slot=slot(used_model["port"]), expires=deadline.expires))
+    finally:
+        # Keep the specialist warm; only paused roles are restored
+        await SCHEDULER.release_specialist(used)
 
-    # Cleanup
-    cleanup_after_specialist()
+    # Final polish via Gatekeeper, only if it fits in the time left
+    final = ""
+    if spec_ans and not fits(gk_port, 256):
+        METRICS.incr("deadline_skipped:polish")
+        limited.append("polish")
+    elif spec_ans:
+        await stage("polish")
+        prompt, n = budget(gk_port, "polish", 256, draft=spec_ans)
+        async with METRICS.timed("polish"):
+            final = spent("polish", await gatekeeper_answer(gk_port, prompt, n_predict=n, on_token=tokens("polish"),
+                                                            expires=deadline.expires))
+    if not (final or spec_ans):
+        return done({"status": "ok", "answer": "The specialist did not return an answer.", "source": "fallback"})
+    return done({"status": "ok", "answer": final or spec_ans, "source": "specialist"})
 
-    # Final polish via Gatekeeper
-    final = await gatekeeper_answer(gk_port, f"Rephrase for clarity and completeness:\n{spec_ans}")
-    return web.json_response({"status": "ok", "answer": final or spec_ans})
+def result_attrs(result: dict) -> dict:
+    """Trace attributes summarising a response (never the question or answer text)."""
+    keys = ("status", "source", "cached", "coalesced", "deadline_limited")
+    return {k: result[k] for k in keys if k in result}
 
-def main():
+async def api_handler(request: web.Request) -> web.Response:
+    data = await read_request(request)
+    with TRACER.trace("api", chars=len(data.get("text") or ""), session="session_id" in data) as trace:
+        try:
+            async with SCHEDULER.admit(), METRICS.request():
+                result = await orchestrate(data)
+        except asyncio.CancelledError:
+            # The client went away; cancelling the pipeline closes its upstream requests
+            METRICS.incr("client_disconnects")
+            raise
+        trace.attrs.update(result_attrs(result))
+        with TRACER.span("serialize"):
+            return web.json_response(result, headers={"X-Trace-Id": trace.id})
+
+async def stream_handler(request: web.Request) -> web.StreamResponse:
+    """
+    Same pipeline as /api, answered as chunked NDJSON: stage markers and
+    tokens while models generate, then a final {"type": "done", ...} line
+    carrying the usual /api response fields.
+    """
+    data = await read_request(request)
+    with TRACER.trace("api/stream", chars=len(data.get("text") or ""), session="session_id" in data) as trace:
+        resp = web.StreamResponse(headers={"Content-Type": "application/x-ndjson", "Cache-Control": "no-cache",
+                                           "X-Trace-Id": trace.id})
+        await resp.prepare(request)
+        trace.attrs.update(events=0, write_ms=0.0)
+
+        async def emit(event):
+            # Per-event spans would swamp the trace; writes are totalled on it instead
+            t0 = time.perf_counter()
+            await resp.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+            trace.attrs["events"] += 1
+            trace.attrs["write_ms"] = round(trace.attrs["write_ms"] + (time.perf_counter() - t0) * 1000, 2)
+
+        try:
+            async with SCHEDULER.admit(), METRICS.request():
+                result = await orchestrate(data, emit=emit)
+        except (asyncio.CancelledError, ConnectionResetError):
+            METRICS.incr("client_disconnects")
+            raise
+        trace.attrs.update(result_attrs(result))
+        with TRACER.span("serialize"):
+            await emit({"type": "done", **result})
+            await resp.write_eof()
+    return resp
+
+async def stats_handler(request: web.Request) -> web.Response:
+    return web.json_response({
+        "http": http_client.get_client().snapshot(),
+        "resources": resource_controller.SAMPLER.snapshot(),
+        "slots": resource_controller.SLOT_STATS,
+        "specialists": POOL.snapshot(),
+        "startup": SUPERVISOR.snapshot(),
+        "cache": CACHE.snapshot(),
+        "kb": get_kb().snapshot(),
+        "scheduler": SCHEDULER.snapshot(REGISTRY.models()),
+        "router": ROUTER.snapshot(),
+        "registry": REGISTRY.snapshot(),
+        "processes": PROCESSES.snapshot(),
+        "footprints": ESTIMATOR.snapshot(),
+        "sessions": SESSIONS.snapshot(),
+        "coalescing": FLIGHTS.snapshot(),
+        "idle_learning": LEARNER.snapshot(),
+        "tracing": TRACER.snapshot()
+    })
+
+async def health_handler(request: web.Request) -> web.Response:
+    """
+    Cheap liveness probe: orchestrator status plus each configured model's
+    port state (up, loading, warming or down) without running inference.
+    """
+    client = http_client.get_client()
+    configured = REGISTRY.models()
+    statuses = await asyncio.gather(*(client.health(m["port"], timeout=0.5) for m in configured))
+    models = []
+    for m, status in zip(configured, statuses):
+        if status == 200:
+            state = "up"
+        elif SUPERVISOR.is_warming(m["name"]):
+            state = "warming"
+        elif status is not None:
+            state = "loading"
+        else:
+            state = "down"
+        models.append({"name": m["name"], "role": m.get("role"), "port": m["port"], "state": state})
+    gk_up = any(x["state"] == "up" for x in models if x["role"] == "gatekeeper")
+    return web.json_response({
+        "status": "ok" if gk_up else "degraded",
+        "uptime_s": round(time.time() - METRICS.started, 1),
+        "models": models
+    })
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.json_response({
+        **METRICS.snapshot(),
+        "admission_waiting": SCHEDULER.waiting,
+        "resources": resource_controller.SAMPLER.snapshot(),
+        "http": http_client.get_client().snapshot()
+    })
+
+async def traces_handler(request: web.Request) -> web.Response:
+    """
+    Recent kept traces, newest first (?limit=20, ?min_ms= for slow ones
+    only), with per-span totals across them; /debug/traces/{id} returns one.
+    """
+    trace_id = request.match_info.get("trace_id")
+    if trace_id:
+        trace = TRACER.find(trace_id)
+        if trace is None:
+            return web.json_response({"status": "error", "message": "trace not found (not sampled or rotated out)"}, status=404)
+        return web.json_response(trace)
+    try:
+        limit = int(request.query.get("limit", "20"))
+        min_ms = float(request.query.get("min_ms", "0"))
+    except ValueError:
+        return web.json_response({"status": "error", "message": "limit and min_ms must be numbers"}, status=400)
+    return web.json_response({"tracing": TRACER.snapshot(), "hot_spans": TRACER.hot_spans(),
+                              "traces": TRACER.query(limit, min_ms)})
+
+async def scheduler_startup(app):
+    SCHEDULER.configure_ports(REGISTRY.models())
+    REGISTRY.subscribe(SCHEDULER.configure_ports)
+
+async def footprint_startup(app):
+    # Parse every GGUF header once up front, off the event loop
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, lambda: [ESTIMATOR.estimate(m) for m in REGISTRY.models()])
+
+async def learner_startup(app):
+    if IDLE_LEARNING:
+        LEARNER.start()
+
+async def learner_cleanup(app):
+    await LEARNER.stop()
+
+async def pool_cleanup(app):
+    await POOL.shutdown()
+
+def build_app() -> web.Application:
     app = web.Application()
+    app.on_startup.append(http_client.on_startup)
+    app.on_startup.append(resource_controller.on_startup)
+    app.on_startup.append(scheduler_startup)
+    app.on_startup.append(footprint_startup)
+    app.on_startup.append(learner_startup)
+    app.on_cleanup.append(learner_cleanup)
+    app.on_cleanup.append(pool_cleanup)
+    app.on_cleanup.append(resource_controller.on_cleanup)
+    app.on_cleanup.append(http_client.on_cleanup)
     app.router.add_post("/api", api_handler)
-    web.run_app(app, host="127.0.0.1", port=8765)
+    app.router.add_post("/api/stream", stream_handler)
+    app.router.add_get("/stats", stats_handler)
+    app.router.add_get("/health", health_handler)
+    app.router.add_get("/metrics", metrics_handler)
+    app.router.add_get("/debug/traces", traces_handler)
+    app.router.add_get("/debug/traces/{trace_id}", traces_handler)
+    return app
+
+def main():
+    # handler_cancellation: a client disconnect cancels its handler, and with
+    # it the upstream llama.cpp requests, so the slots stop generating
+    web.run_app(build_app(), host="127.0.0.1", port=8765, handler_cancellation=True)
 
 if __name__ == "__main__":
     main()
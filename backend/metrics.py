@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import time
+from contextlib import asynccontextmanager
+from tracing import TRACER
+
+# Upper bounds in milliseconds; the last bucket catches everything slower.
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.count += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        for i, bound in enumerate(self.buckets):
+            if ms <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def quantile(self, q: float):
+        """Bucket upper bound containing the q-th observation (approximate)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{b}" for b in self.buckets] + ["inf"]
+        return {"count": self.count,
+                "avg_ms": round(self.sum_ms / self.count, 1) if self.count else None,
+                "max_ms": round(self.max_ms, 1),
+                "p50_ms": self.quantile(0.5), "p95_ms": self.quantile(0.95),
+                "buckets": dict(zip(labels, self.counts))}
+
+class Metrics:
+    """Per-stage latency histograms plus in-flight request gauges."""
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.started = time.time()
+
+    def observe(self, stage: str, ms: float):
+        self.histograms.setdefault(stage, Histogram()).observe(ms)
+
+    def incr(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @asynccontextmanager
+    async def timed(self, stage: str):
+        """Observe the block's duration under stage; it is also a span of the current trace."""
+        t0 = time.perf_counter()
+        try:
+            with TRACER.span(stage):
+                yield
+        finally:
+            self.observe(stage, (time.perf_counter() - t0) * 1000)
+
+    @asynccontextmanager
+    async def request(self):
+        """Track one API request for queue depth and total latency."""
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            async with self.timed("request"):
+                yield
+        finally:
+            self.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        return {"uptime_s": round(time.time() - self.started, 1),
+                "requests": self.requests,
+                "queue_depth": self.in_flight,
+                "max_queue_depth": self.max_in_flight,
+                "counters": dict(sorted(self.counters.items())),
+                "stages": {k: h.snapshot() for k, h in sorted(self.histograms.items())}}
+
+METRICS = Metrics()
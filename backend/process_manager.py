@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import os, time, signal, asyncio
+from pathlib import Path
+from registry import REGISTRY
+
+ROOT = Path(__file__).resolve().parent.parent
+LLAMA_SERVER = Path(os.environ.get("ULTRA_AI_LLAMA_SERVER") or ROOT / "llama.cpp" / "build" / "bin" / "llama-server")
+SLOT_DIR = ROOT / "data" / "slots"
+STOP_SCRIPT = ROOT / "scripts" / "stop_model.sh"
+STOP_TIMEOUT = 10.0         # seconds between SIGTERM and SIGKILL
+
+def _safe(name: str) -> str:
+    return name.replace(" ", "_")
+
+def server_args(model) -> list:
+    """
+    llama-server command line for model; mirrors scripts/start_model.sh.
+    "context" is per slot, so the total --ctx-size scales with "slots".
+    """
+    slots = max(1, int(model.get("slots", 1)))
+    return [str(LLAMA_SERVER), "-m", model["path"], "--host", "127.0.0.1", "--port", str(model["port"]),
+            "--ctx-size", str(int(model.get("context", 4096)) * slots), "--parallel", str(slots), "--cont-batching",
+            "--threads", str(model.get("threads", 4)),
+            "--slot-save-path", str(SLOT_DIR), "--mlock=false", "--embedding=false", "--no-mmap=false"]
+
+async def port_in_use(port: int, timeout: float = 0.2) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), timeout)
+    except Exception:
+        return False
+    writer.close()
+    return True
+
+class ProcessManager:
+    """
+    Spawns and tracks llama-server children directly instead of going
+    through start_model.sh/stop_model.sh, so a role switch costs one fork
+    rather than several jq/lsof runs. Return values match the scripts'
+    (code, stdout, stderr). PID files are still written for stop_all.sh.
+    """
+    def __init__(self):
+        self.procs = {}     # name -> {"proc", "pid", "port", "started", "log", "log_path"}
+        self.exits = {}     # name -> {"code", "at", "uptime_s"}
+        self.stats = {"spawned": 0, "stopped": 0, "killed": 0, "already_running": 0, "script_stops": 0}
+
+    def _pidfile(self, name):
+        return ROOT / f"{_safe(name)}.pid"
+
+    def running(self, name) -> bool:
+        entry = self.procs.get(name)
+        return bool(entry) and entry["proc"].returncode is None
+
+    async def _watch(self, name, entry):
+        code = await entry["proc"].wait()
+        entry["log"].close()
+        self.exits[name] = {"code": code, "at": time.time(), "uptime_s": round(time.time() - entry["started"], 1)}
+        if self.procs.get(name) is entry:
+            self.procs.pop(name)
+            try:
+                self._pidfile(name).unlink()
+            except OSError:
+                pass
+
+    async def start(self, name_or_role):
+        model = REGISTRY.resolve(name_or_role)
+        if not model:
+            return 3, "", f"Model not found for: {name_or_role}"
+        name = model["name"]
+        if self.running(name) or await port_in_use(model["port"]):
+            self.stats["already_running"] += 1
+            return 0, f"Already running: {name} on port {model['port']}", ""
+        if not os.access(LLAMA_SERVER, os.X_OK):
+            return 1, "", f"llama-server binary not found at {LLAMA_SERVER}"
+        if not os.path.isfile(model["path"]):
+            return 4, "", f"Model file missing: {model['path']}"
+        SLOT_DIR.mkdir(parents=True, exist_ok=True)
+        log_path = ROOT / f"{_safe(name)}.log"
+        log = open(log_path, "ab")
+        try:
+            # Own session so the server outlives an orchestrator restart, like nohup
+            proc = await asyncio.create_subprocess_exec(*server_args(model), stdin=asyncio.subprocess.DEVNULL,
+                                                        stdout=log, stderr=asyncio.subprocess.STDOUT,
+                                                        start_new_session=True)
+        except Exception as e:
+            log.close()
+            return 1, "", str(e)
+        entry = {"proc": proc, "pid": proc.pid, "port": model["port"], "started": time.time(),
+                 "log": log, "log_path": str(log_path)}
+        self.procs[name] = entry
+        self._pidfile(name).write_text(str(proc.pid))
+        asyncio.ensure_future(self._watch(name, entry))
+        self.stats["spawned"] += 1
+        return 0, "OK", ""
+
+    async def stop(self, name_or_role, timeout: float = STOP_TIMEOUT):
+        model = REGISTRY.resolve(name_or_role)
+        if not model:
+            return 3, "", f"Model not found for: {name_or_role}"
+        name = model["name"]
+        entry = self.procs.get(name)
+        if entry and entry["proc"].returncode is None:
+            proc = entry["proc"]
+            proc.terminate()
+            try:
+                await asyncio.wait_for(proc.wait(), timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                self.stats["killed"] += 1
+            self.stats["stopped"] += 1
+            return 0, f"Stopped {name}", ""
+        # Started outside this process (start_all.sh): fall back to its PID file
+        pidfile = self._pidfile(name)
+        try:
+            os.kill(int(pidfile.read_text().strip()), signal.SIGTERM)
+            self.stats["stopped"] += 1
+            signalled = True
+        except (OSError, ValueError):
+            signalled = False
+        try:
+            pidfile.unlink()
+        except OSError:
+            pass
+        if not signalled and await port_in_use(model["port"]):
+            # Unknown owner; only the script's lsof lookup can find it
+            self.stats["script_stops"] += 1
+            proc = await asyncio.create_subprocess_exec(str(STOP_SCRIPT), name, stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.PIPE)
+            out, err = await proc.communicate()
+            return proc.returncode, out.decode(errors="ignore"), err.decode(errors="ignore")
+        return 0, f"Stopped {name}", ""
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        children = {name: {"pid": e["pid"], "port": e["port"], "uptime_s": round(now - e["started"], 1),
+                           "log": e["log_path"]} for name, e in self.procs.items()}
+        return {**self.stats, "children": children, "exits": self.exits}
+
+PROCESSES = ProcessManager()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import os, json, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+CONFIG = Path(os.environ.get("ULTRA_AI_CONFIG") or ROOT / "models.json")
+
+class ModelRegistry:
+    """
+    In-memory view of models.json indexed by name, role, domain and port.
+    Every lookup stats the file and reparses it only when its mtime changed;
+    a broken edit keeps the last good config.
+    """
+    def __init__(self, path: Path = CONFIG):
+        self.path = Path(path)
+        self._mtime = None
+        self._models = []
+        self.by_name = {}
+        self.by_role = {}
+        self.by_domain = {}
+        self.by_port = {}
+        self.version = 0
+        self.loaded_at = 0.0
+        self.errors = 0
+        self._listeners = []
+
+    def _index(self, models):
+        self._models = models
+        self.by_name = {m["name"]: m for m in models}
+        self.by_role, self.by_domain = {}, {}
+        for m in models:
+            self.by_role.setdefault(m.get("role"), []).append(m)
+            for d in m.get("domain") or []:
+                self.by_domain.setdefault(d, []).append(m)
+        for group in self.by_domain.values():
+            group.sort(key=lambda x: x.get("priority", 10))
+        self.by_port = {m["port"]: m for m in models}
+
+    def refresh(self) -> bool:
+        """Reload if models.json changed on disk; returns True when it did."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            models = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as e:
+            self.errors += 1
+            self._mtime = mtime
+            print(f"Registry reload error: {e}")
+            return False
+        self._mtime = mtime
+        self._index(models)
+        self.version += 1
+        self.loaded_at = time.time()
+        for fn in self._listeners:
+            try:
+                fn(models)
+            except Exception as e:
+                print(f"Registry listener error: {e}")
+        return True
+
+    def subscribe(self, fn):
+        """Call fn(models) after every reload."""
+        self._listeners.append(fn)
+
+    def models(self) -> list:
+        self.refresh()
+        return self._models
+
+    def get(self, name):
+        self.refresh()
+        return self.by_name.get(name)
+
+    def role(self, role) -> list:
+        self.refresh()
+        return list(self.by_role.get(role, []))
+
+    def domain(self, domain) -> list:
+        """Models serving domain, lowest priority value first."""
+        self.refresh()
+        return list(self.by_domain.get(domain, []))
+
+    def port(self, port):
+        self.refresh()
+        return self.by_port.get(port)
+
+    def resolve(self, name_or_role):
+        """Model by name, else the first model with that role (like start_model.sh)."""
+        return self.get(name_or_role) or (self.role(name_or_role) or [None])[0]
+
+    def domains(self, role="specialist") -> list:
+        self.refresh()
+        return sorted({d for m in self.by_role.get(role, []) for d in (m.get("domain") or [])})
+
+    def snapshot(self) -> dict:
+        return {"path": str(self.path), "version": self.version, "models": len(self._models),
+                "loaded_at": self.loaded_at, "errors": self.errors}
+
+REGISTRY = ModelRegistry()
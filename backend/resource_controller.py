@@ -1,9 +1,18 @@
 #!/usr/bin/env python3
-import os, time, json, subprocess, signal
+import os, time, asyncio
+from collections import deque
 from pathlib import Path
+from http_client import get_client
+from registry import REGISTRY
+from process_manager import PROCESSES
+from tracing import TRACER
 
 ROOT = Path(__file__).resolve().parent.parent
-CONFIG = ROOT / "models.json"
+# "process" spawns llama-server directly; "script" uses start_model.sh/stop_model.sh
+LAUNCHER = os.environ.get("ULTRA_AI_LAUNCHER", "process")
+# Background (idle learning) work only runs below this CPU load and above this MemAvailable
+IDLE_CPU_MAX = float(os.environ.get("ULTRA_AI_IDLE_CPU", "0.35"))
+IDLE_MEM_MIN_MB = int(os.environ.get("ULTRA_AI_IDLE_MEM_MB", "1024"))
 
 def _read_mem_available_kb():
     try:
@@ -15,64 +24,185 @@ def _read_mem_available_kb():
         return 0
     return 0
 
+def _read_cpu_times():
+    with open("/proc/stat","r") as f:
+        parts = f.readline().split()
+        vals = list(map(int, parts[1:]))
+        return vals[3], sum(vals)
+
+class ResourceSampler:
+    """
+    Background sampler keeping a rolling CPU / MemAvailable snapshot so
+    admission checks never block the event loop.
+    """
+    def __init__(self, interval=1.0, window=5):
+        self.interval = interval
+        self.cpu_history = deque(maxlen=window)
+        self.cpu = 0.5
+        self.mem_available_kb = 0
+        self.updated = 0.0
+        self._prev = None
+        self._task = None
+
+    def sample(self):
+        try:
+            idle, total = _read_cpu_times()
+            if self._prev:
+                idle_delta = idle - self._prev[0]
+                total_delta = total - self._prev[1]
+                if total_delta > 0:
+                    self.cpu = max(0.0, min(1.0, 1.0 - (idle_delta / total_delta)))
+                    self.cpu_history.append(self.cpu)
+            self._prev = (idle, total)
+        except Exception:
+            pass
+        self.mem_available_kb = _read_mem_available_kb()
+        self.updated = time.time()
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self.sample()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self):
+        avg = sum(self.cpu_history) / len(self.cpu_history) if self.cpu_history else self.cpu
+        return {"cpu": round(self.cpu, 3), "cpu_avg": round(avg, 3),
+                "mem_available_mb": self.mem_available_kb // 1024, "updated": self.updated}
+
+SAMPLER = ResourceSampler()
+SLOT_STATS = {"saves": 0, "restores": 0, "tokens_saved": 0, "tokens_restored": 0}
+_SAVED_SLOTS = {}   # model name -> slot ids saved before the last pause
+
 def _read_cpu_load():
-    try:
-        def read():
-            with open("/proc/stat","r") as f:
-                parts = f.readline().split()
-                vals = list(map(int, parts[1:]))
-                idle = vals[3]
-                total = sum(vals)
-                return idle, total
-        idle1, total1 = read(); time.sleep(1.0); idle2, total2 = read()
-        idle_delta = idle2 - idle1
-        total_delta = total2 - total1
-        if total_delta <= 0: return 0.5
-        usage = 1.0 - (idle_delta / total_delta)
-        return max(0.0, min(1.0, usage))
-    except Exception:
-        return 0.5
+    with TRACER.span("cpu_load") as span:
+        span["cpu"] = SAMPLER.cpu if SAMPLER.updated and SAMPLER.cpu_history else 0.5
+        return span["cpu"]
+
+def device_idle(cpu_max=IDLE_CPU_MAX, mem_min_mb=IDLE_MEM_MIN_MB):
+    """
+    True when the rolling CPU average and MemAvailable leave room for
+    background work. A reading the sampler cannot take (e.g. /proc/stat
+    is not readable on newer Android) does not count against idleness.
+    """
+    if SAMPLER.cpu_history and sum(SAMPLER.cpu_history) / len(SAMPLER.cpu_history) > cpu_max:
+        return False
+    return not SAMPLER.mem_available_kb or SAMPLER.mem_available_kb // 1024 >= mem_min_mb
 
 def load_models():
-    with open(CONFIG, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """Current models.json contents (cached; reloaded when the file changes)."""
+    return REGISTRY.models()
 
 def get_model_by_name(name, models=None):
-    models = models or load_models()
+    if models is None:
+        return REGISTRY.get(name)
     for m in models:
         if m.get("name") == name:
             return m
     return None
 
 def list_models_by_role(role, models=None):
-    models = models or load_models()
+    if models is None:
+        return REGISTRY.role(role)
     return [m for m in models if m.get("role") == role]
 
-def can_start_specialist(preferred, mem_min_mb=2200, cpu_max=0.92):
-    mem_kb = _read_mem_available_kb()
-    cpu = _read_cpu_load()
-    return (mem_kb // 1024) >= mem_min_mb and cpu <= cpu_max
+async def run_script(script, args=None, env=None, timeout=20):
+    with TRACER.span("script", script=Path(script).name, args=args or []) as span:
+        code, out, err = await _run_script(script, args, env, timeout)
+        span["code"] = code
+        return code, out, err
 
-def run_script(script, args=None, env=None, timeout=20):
+async def _run_script(script, args, env, timeout):
     cmd = [str(script)] + (args or [])
     try:
-        res = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout, check=False)
-        return res.returncode, res.stdout.decode(errors="ignore"), res.stderr.decode(errors="ignore")
-    except subprocess.TimeoutExpired:
-        return 124, "", "timeout"
+        proc = await asyncio.create_subprocess_exec(*cmd, env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
     except Exception as e:
         return 1, "", str(e)
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(), timeout)
+        return proc.returncode, out.decode(errors="ignore"), err.decode(errors="ignore")
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return 124, "", "timeout"
+
+async def start_model(name_or_role):
+    with TRACER.span("start_model", model=name_or_role, launcher=LAUNCHER) as span:
+        if LAUNCHER == "script":
+            code, out, err = await run_script(ROOT / "scripts" / "start_model.sh", [name_or_role])
+        else:
+            code, out, err = await PROCESSES.start(name_or_role)
+        span["code"] = code
+        return code, out, err
+
+async def stop_model(name_or_role):
+    with TRACER.span("stop_model", model=name_or_role, launcher=LAUNCHER) as span:
+        if LAUNCHER == "script":
+            code, out, err = await run_script(ROOT / "scripts" / "stop_model.sh", [name_or_role])
+        else:
+            code, out, err = await PROCESSES.stop(name_or_role)
+        span["code"] = code
+        return code, out, err
 
-def pause_role(name_or_role):
-    script = ROOT / "scripts" / "stop_model.sh"
-    return run_script(script, [name_or_role])
+def _resolve(name_or_role, models=None):
+    if models is None:
+        return REGISTRY.resolve(name_or_role)
+    return get_model_by_name(name_or_role, models) or (list_models_by_role(name_or_role, models) or [None])[0]
 
-def resume_role(name_or_role):
-    script = ROOT / "scripts" / "start_model.sh"
-    return run_script(script, [name_or_role])
+def _slot_file(model, slot_id):
+    return f"{model['name'].replace(' ', '_')}-slot{slot_id}.bin"
+
+async def save_slots(model):
+    """
+    Persist each llama.cpp slot's KV cache (needs --slot-save-path) so the
+    prompt cache survives a stop/start cycle.
+    """
+    saved = []
+    for slot_id in range(max(1, int(model.get("slots", 1)))):
+        res = await get_client().slot_action(model["port"], slot_id, "save", _slot_file(model, slot_id))
+        if res is not None:
+            saved.append(slot_id)
+            SLOT_STATS["saves"] += 1
+            SLOT_STATS["tokens_saved"] += int(res.get("n_saved") or 0)
+    if saved:
+        _SAVED_SLOTS[model["name"]] = saved
+    return saved
+
+async def restore_slots(model):
+    """Reload slots saved by save_slots() once the server is ready again."""
+    restored = 0
+    for slot_id in _SAVED_SLOTS.pop(model["name"], []):
+        res = await get_client().slot_action(model["port"], slot_id, "restore", _slot_file(model, slot_id))
+        if res is not None:
+            SLOT_STATS["restores"] += 1
+            restored += int(res.get("n_restored") or 0)
+    SLOT_STATS["tokens_restored"] += restored
+    return restored
+
+async def pause_role(name_or_role):
+    model = _resolve(name_or_role)
+    if model and model.get("role") in ("gatekeeper", "librarian"):
+        await save_slots(model)
+    return await stop_model(name_or_role)
+
+async def resume_role(name_or_role):
+    return await start_model(name_or_role)
 
 def choose_fallback_specialist(domain, models=None):
-    models = models or load_models()
+    models = load_models() if models is None else models
     specialists = [m for m in models if m.get("role") == "specialist"]
     if domain:
         domain_filtered = [m for m in specialists if domain in (m.get("domain") or [])]
@@ -82,29 +212,8 @@ def choose_fallback_specialist(domain, models=None):
     pool.sort(key=lambda x: x.get("priority", 10))
     return pool
 
-def ensure_specialist_running(preferred_name=None, domain=None):
-    models = load_models()
-    fallbacks = choose_fallback_specialist(domain, models=models)
-    if preferred_name:
-        pref = get_model_by_name(preferred_name, models=models)
-        if pref:
-            fallbacks = [pref] + [m for m in fallbacks if m["name"] != preferred_name]
-    for phase in ["none", "pause_librarian", "pause_gatekeeper"]:
-        if phase == "pause_librarian":
-            pause_role("librarian")
-        elif phase == "pause_gatekeeper":
-            pause_role("gatekeeper")
-        for cand in fallbacks:
-            if not can_start_specialist(cand):
-                continue
-            rc, out, err = resume_role(cand["name"])
-            if rc == 0:
-                return True, cand["name"], f"started ({phase})"
-    resume_role("gatekeeper"); resume_role("librarian")
-    return False, "", "no_specialist_available"
-
-def cleanup_after_specialist():
-    specialists = list_models_by_role("specialist")
-    for m in specialists:
-        pause_role(m["name"])
-    resume_role("gatekeeper"); resume_role("librarian")
+async def on_startup(app):
+    SAMPLER.start()
+
+async def on_cleanup(app):
+    await SAMPLER.stop()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import os, re
+from librarian import librarian_probe
+from registry import REGISTRY
+
+# Routing thresholds. A keyword decision needs ROUTE_CONFIDENT; the optional
+# Librarian logprob probe (ULTRA_AI_ROUTER_PROBE=1) settles the rest.
+ROUTE_CONFIDENT = float(os.environ.get("ULTRA_AI_ROUTE_CONFIDENT", "0.75"))
+PROBE_ENABLED = os.environ.get("ULTRA_AI_ROUTER_PROBE", "0") == "1"
+PROBE_ANSWER = 0.85         # mean token probability above which the query is easy
+PROBE_ESCALATE = 0.45       # ... and below which it goes straight to the Librarian
+
+# Keywords per specialist domain (the "domain" lists in models.json). Domains
+# without an entry, e.g. "general", are never detected, only used as fallback.
+DOMAIN_KEYWORDS = {
+    "coding": set("""
+        code coding program programming function method class bug debug compile compiler error exception
+        traceback stacktrace python javascript typescript java rust golang c++ c# kotlin swift sql regex
+        api json yaml bash shell script unittest refactor variable loop array dict import npm pip git
+    """.split()),
+    "reasoning": set("""
+        prove proof derive logic logical puzzle riddle calculate compute solve equation math maths
+        probability theorem deduce infer step-by-step integral derivative
+    """.split()),
+    "writing": set("""
+        write rewrite essay poem story draft email letter blog article paragraph tone proofread edit
+        headline slogan lyrics
+    """.split()),
+    "analysis": set("""
+        analyze analyse analysis compare comparison evaluate assess pros cons tradeoff tradeoffs
+        summarize summarise trend trends review critique
+    """.split()),
+    "chat": set("""
+        hi hello hey thanks thank morning evening joke chat bye goodbye
+    """.split()),
+}
+CODE_PATTERNS = re.compile(r"```|\bdef \w+\(|\bfunction \w*\(|=>|;\s*$|\{\s*$|</?\w+>|\w+\(\)", re.M)
+MULTI_STEP = re.compile(r"\b(step by step|in detail|explain why|walk me through|prove that)\b", re.I)
+WORD_RE = re.compile(r"[a-z0-9+#\-]+")
+
+class Router:
+    """
+    Millisecond routing ahead of the Gatekeeper: detects the request's domain
+    from keywords and decides "answer" (Gatekeeper answers directly),
+    "escalate" (skip the Gatekeeper probe, go to the Librarian) or "probe"
+    (fall back to the Gatekeeper's LOWCONF pass).
+    """
+    def __init__(self):
+        self.stats = {"answer": 0, "escalate": 0, "probe": 0, "probes": 0}
+
+    def classify(self, text: str) -> tuple[str | None, float]:
+        """Return (domain, score) for the best keyword match among configured domains."""
+        words = WORD_RE.findall(text.lower())
+        best, best_score = None, 0.0
+        domains = REGISTRY.domains()
+        for domain, keywords in DOMAIN_KEYWORDS.items():
+            if domain not in domains:
+                continue
+            score = sum(1 for w in words if w in keywords)
+            if domain == "coding" and CODE_PATTERNS.search(text):
+                score += 2
+            if score > best_score:
+                best, best_score = domain, score
+        return best, best_score
+
+    def score(self, text: str) -> dict:
+        """Keyword-only route: {"domain", "decision", "confidence", "method"}."""
+        domain, hits = self.classify(text)
+        n_words = len(text.split())
+        decision, confidence = "probe", 0.5
+        if domain == "chat" and n_words <= 12:
+            decision, confidence = "answer", min(1.0, 0.7 + 0.1 * hits)
+        elif domain in ("coding", "reasoning", "analysis"):
+            # Specialist-domain requests that are long or explicitly multi-step
+            # rarely get a confident Gatekeeper answer
+            confidence = min(1.0, 0.4 + 0.15 * hits + (0.2 if MULTI_STEP.search(text) else 0) + (0.1 if n_words > 40 else 0))
+            decision = "escalate" if confidence >= ROUTE_CONFIDENT else "probe"
+        if confidence < ROUTE_CONFIDENT:
+            decision = "probe"
+        return {"domain": domain, "decision": decision, "confidence": round(confidence, 3), "method": "keywords"}
+
+    async def route(self, text: str, lib_port: int | None = None, probe_prompt: str | None = None) -> dict:
+        """Keyword route, refined by a Librarian logprob probe when enabled and still undecided."""
+        result = self.score(text)
+        if result["decision"] == "probe" and PROBE_ENABLED and lib_port:
+            self.stats["probes"] += 1
+            p = await librarian_probe(lib_port, probe_prompt or text)
+            if p is not None:
+                if p >= PROBE_ANSWER:
+                    result.update(decision="answer", confidence=round(p, 3), method="logprobs")
+                elif p <= PROBE_ESCALATE:
+                    result.update(decision="escalate", confidence=round(1 - p, 3), method="logprobs")
+        self.stats[result["decision"]] += 1
+        return result
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "domains": REGISTRY.domains(), "probe_enabled": PROBE_ENABLED}
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+import os, time, asyncio
+from contextlib import asynccontextmanager
+from http_client import get_client
+from metrics import METRICS
+from tracing import TRACER
+
+MAX_ACTIVE_REQUESTS = int(os.environ.get("ULTRA_AI_MAX_ACTIVE", "4"))
+
+class Scheduler:
+    """
+    Admission queue and model lifecycle coordinator for the orchestrator.
+
+    - At most MAX_ACTIVE_REQUESTS pipelines run at once; the rest wait in FIFO
+      order and their wait time is recorded as "admission_wait".
+    - Concurrent requests for the same specialist share one acquire, so only
+      one lifecycle change happens and every waiter is pinned against eviction.
+    - Per-port in-flight limits follow each model's llama.cpp slot count.
+    """
+    def __init__(self, pool, max_active=MAX_ACTIVE_REQUESTS):
+        self.pool = pool
+        self.max_active = max_active
+        self._admission = None
+        self._groups = {}       # (preferred, domain) -> {"task", "waiters"}
+        self.waiting = 0
+        self.active = 0
+        self.stats = {"admitted": 0, "acquires": 0, "batched": 0}
+
+    def configure_ports(self, models):
+        client = get_client()
+        for m in models:
+            client.set_port_limit(m["port"], max(1, int(m.get("slots", 1))))
+
+    @asynccontextmanager
+    async def admit(self):
+        if self._admission is None:
+            self._admission = asyncio.Semaphore(self.max_active)
+        t0 = time.perf_counter()
+        self.waiting += 1
+        admitted = False
+        try:
+            async with self._admission:
+                admitted = True
+                self.waiting -= 1
+                self.active += 1
+                self.stats["admitted"] += 1
+                wait_ms = (time.perf_counter() - t0) * 1000
+                METRICS.observe("admission_wait", wait_ms)
+                TRACER.annotate(admission_wait_ms=round(wait_ms, 2))
+                try:
+                    yield
+                finally:
+                    self.active -= 1
+        finally:
+            if not admitted:
+                self.waiting -= 1
+
+    async def acquire_specialist(self, preferred=None, domain=None, background=False):
+        """
+        Return (ok, name, notes); batches concurrent requests for the same target.
+        background acquires (idle work) never pause the Gatekeeper/Librarian,
+        and cancelling one abandons its cold start instead of finishing it.
+        """
+        key = (preferred, domain, background)
+        group = self._groups.get(key)
+        if group is None or group["task"].done():
+            group = {"waiters": 1}
+            group["task"] = asyncio.ensure_future(
+                self.pool.acquire(preferred, domain, pins=lambda: group["waiters"], allow_pause=not background))
+            self._groups[key] = group
+            group["task"].add_done_callback(
+                lambda t: self._groups.pop(key, None) if self._groups.get(key) is group else None)
+            self.stats["acquires"] += 1
+        else:
+            group["waiters"] += 1
+            self.stats["batched"] += 1
+
+        t0 = time.perf_counter()
+        try:
+            result = await asyncio.shield(group["task"])
+        except asyncio.CancelledError:
+            if background:
+                # Only one idle job runs at a time, so nobody else waits on this start
+                group["task"].cancel()
+            group["task"].add_done_callback(self._release_abandoned)
+            raise
+        if result[0]:
+            METRICS.observe(f"specialist_wait:{result[1]}", (time.perf_counter() - t0) * 1000)
+        return result
+
+    def _release_abandoned(self, task):
+        # A waiter was cancelled after being counted; drop its pin
+        if not task.cancelled() and task.exception() is None and task.result()[0]:
+            asyncio.ensure_future(self.pool.release(task.result()[1]))
+
+    async def release_specialist(self, name):
+        await self.pool.release(name)
+
+    def snapshot(self, models=()):
+        ports = get_client().snapshot().get("ports", {})
+        per_model = {m["name"]: ports[m["port"]] for m in models if m["port"] in ports}
+        return {**self.stats, "max_active": self.max_active, "active": self.active, "waiting": self.waiting,
+                "pending_acquires": len(self._groups), "models": per_model}
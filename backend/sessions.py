@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+import os, time, uuid, asyncio
+from collections import OrderedDict, Counter
+
+MAX_SESSIONS = int(os.environ.get("ULTRA_AI_MAX_SESSIONS", "256"))
+SESSION_IDLE_S = float(os.environ.get("ULTRA_AI_SESSION_IDLE", "1800"))
+HISTORY_TOKENS = int(os.environ.get("ULTRA_AI_HISTORY_TOKENS", "1024"))
+SUMMARY_TOKENS = 200        # cap on the rolling summary of dropped turns
+CHARS_PER_TOKEN = 4         # rough estimate; good enough for budgeting
+
+def count_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _clip(text: str, tokens: int) -> str:
+    limit = tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + " ..."
+
+class Session:
+    def __init__(self, sid):
+        self.id = sid
+        self.turns = []         # [(user, assistant)], oldest first
+        self.summary = ""       # condensed turns that fell out of the budget
+        self.slots = {}         # port -> llama.cpp slot this session's KV cache lives in
+        self.created = self.last_used = time.time()
+        self.summarizing = None
+
+    def history(self) -> str:
+        """Prompt block for the conversation so far; append-only between summaries."""
+        if not (self.summary or self.turns):
+            return ""
+        parts = ["Conversation so far:\n"]
+        if self.summary:
+            parts.append(f"Summary of earlier turns: {self.summary}\n")
+        for user, assistant in self.turns:
+            parts.append(f"User: {user}\nAssistant: {assistant}\n")
+        return "".join(parts) + "\n"
+
+    def recent_questions(self, n: int = 2) -> str:
+        """The user's last n questions, oldest first, e.g. to route a follow-up by its topic."""
+        return "\n".join(user for user, _ in self.turns[-n:])
+
+class SessionStore:
+    """
+    Bounded server-side conversation store. Sessions idle for longer than
+    idle_s, or beyond max_sessions (least recently used first), are dropped.
+    Each session keeps its history within a token budget: the oldest turns
+    are folded into a rolling summary (capped at SUMMARY_TOKENS), so the
+    per-turn prompt stays a constant size. Each session is pinned to one
+    llama.cpp slot per port so its cached prefix is reused turn after turn.
+    """
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_s=SESSION_IDLE_S, history_tokens=HISTORY_TOKENS):
+        self.max_sessions = max_sessions
+        self.idle_s = idle_s
+        self.history_tokens = history_tokens
+        self.sessions = OrderedDict()
+        self.summarizer = None      # async fn(text) -> summary, set by the orchestrator
+        self.stats = {"created": 0, "evicted": 0, "turns": 0, "summaries": 0}
+
+    def evict_idle(self):
+        cutoff = time.time() - self.idle_s
+        while self.sessions:
+            sid, s = next(iter(self.sessions.items()))
+            if s.last_used >= cutoff and len(self.sessions) <= self.max_sessions:
+                break
+            self.sessions.pop(sid)
+            self.stats["evicted"] += 1
+
+    def get(self, sid=None) -> Session:
+        """
+        Return the session for sid, or a new one under a fresh server-issued
+        id when sid is empty, unknown (e.g. evicted) or not a string; clients
+        cannot choose ids.
+        """
+        self.evict_idle()
+        if not isinstance(sid, str):
+            sid = None
+        s = self.sessions.get(sid) if sid else None
+        if s is None:
+            s = Session(uuid.uuid4().hex)
+            self.sessions[s.id] = s
+            self.stats["created"] += 1
+            self.evict_idle()
+        s.last_used = time.time()
+        self.sessions.move_to_end(s.id)
+        return s
+
+    def slot_for(self, session: Session, port: int, n_slots: int) -> int:
+        """Pin session to the slot on port shared by the fewest live sessions."""
+        slot = session.slots.get(port)
+        if slot is None or slot >= n_slots:
+            load = Counter(s.slots.get(port) for s in self.sessions.values() if s is not session)
+            slot = min(range(n_slots), key=lambda i: load[i])
+            session.slots[port] = slot
+        return slot
+
+    def append(self, session: Session, user: str, assistant: str):
+        session.turns.append((user, assistant))
+        session.last_used = time.time()
+        self.stats["turns"] += 1
+        self._trim(session)
+
+    def _trim(self, session: Session):
+        """Fold the oldest turns into the summary until the history fits the budget."""
+        dropped = []
+        while len(session.turns) > 1 and count_tokens(session.history()) > self.history_tokens:
+            dropped.append(session.turns.pop(0))
+        if not dropped:
+            return
+        text = " ".join(f"User asked: {u} Assistant said: {a}" for u, a in dropped)
+        source = f"{session.summary}\n{text}".strip()
+        # Extractive placeholder right away; a model summary replaces it in the background
+        session.summary = _clip(" ".join(filter(None, [session.summary, _clip(text, SUMMARY_TOKENS // 2)])), SUMMARY_TOKENS)
+        if self.summarizer:
+            session.summarizing = asyncio.ensure_future(self._summarize(session, source, session.summary))
+
+    async def _summarize(self, session: Session, source: str, placeholder: str):
+        try:
+            summary = await self.summarizer(source)
+        except Exception as e:
+            print(f"Session summary error: {e}")
+            return
+        # Only replace the placeholder if no newer trim happened meanwhile
+        if summary and session.summary == placeholder:
+            session.summary = _clip(summary.strip(), SUMMARY_TOKENS)
+            self.stats["summaries"] += 1
+
+    def snapshot(self) -> dict:
+        self.evict_idle()
+        return {**self.stats, "active": len(self.sessions), "max_sessions": self.max_sessions,
+                "idle_s": self.idle_s, "history_tokens": self.history_tokens}
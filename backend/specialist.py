@@ -1,39 +1,36 @@
 #!/usr/bin/env python3
-import json, aiohttp, asyncio
-from pathlib import Path
-
-ROOT = Path(__file__).resolve().parent.parent
-MODELS = json.loads((ROOT / "models.json").read_text(encoding="utf-8"))
+from http_client import get_client, stream_text
+from registry import REGISTRY
 
 def pick_specialist(domain_hint: str | None):
     """
     Select the most appropriate specialist model based on domain hint and priority.
     """
-    pool = [m for m in MODELS if m.get("role") == "specialist"]
+    pool = REGISTRY.role("specialist")
     if domain_hint:
-        domain_filtered = [m for m in pool if domain_hint in (m.get("domain") or [])]
-        pool = domain_filtered or pool
+        pool = [m for m in REGISTRY.domain(domain_hint) if m.get("role") == "specialist"] or pool
     pool.sort(key=lambda x: x.get("priority", 10))
     return pool[0] if pool else None
 
-async def call_specialist(model, prompt: str, n_predict: int = 512, temp: float = 0.7):
+async def call_specialist(model, prompt: str, n_predict: int = 512, temp: float = 0.7, on_token=None, slot=None, expires=None):
     """
     Send a query to the selected specialist model's llama.cpp server.
     """
     port = model["port"]
-    url = f"http://127.0.0.1:{port}/completion"
     payload = {
         "prompt": prompt,
         "n_predict": n_predict,
-        "temperature": temp
+        "temperature": temp,
+        "cache_prompt": True
     }
+    if slot is not None:
+        payload["id_slot"] = slot
     try:
-        async with aiohttp.ClientSession() as sess:
-            async with sess.post(url, json=payload, timeout=60) as r:
-                r.raise_for_status()
-                data = await r.json()
-                text = data.get("content") or data.get("text") or ""
-                return text.strip()
+        if on_token is None:
+            data = await get_client().completion("specialist", port, payload, expires=expires)
+            text = data.get("content") or data.get("text") or ""
+            return text.strip()
+        return await stream_text("specialist", port, payload, on_token, expires=expires)
     except Exception as e:
         print(f"Specialist error: {e}")
         return ""
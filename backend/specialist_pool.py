@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+import os, time, asyncio
+from collections import OrderedDict, Counter
+import resource_controller as rc
+from supervisor import SUPERVISOR
+from footprint import estimate_footprint_mb
+from tracing import TRACER
+
+RESERVE_MB = 512          # headroom kept free for the OS and the orchestrator
+MAX_COLD_START_S = float(os.environ.get("ULTRA_AI_MAX_COLD_START", "90"))
+
+class SpecialistPool:
+    """
+    Keeps recently used specialists resident. Least-recently-used models are
+    evicted only when MemAvailable cannot fit the next one; Librarian and
+    Gatekeeper are paused only as a last resort and resumed on release.
+    """
+    def __init__(self, reserve_mb=RESERVE_MB):
+        self.reserve_mb = reserve_mb
+        self.resident = OrderedDict()   # name -> last used timestamp, LRU first
+        self.paused = []                # roles paused to make room, in pause order
+        self.pins = Counter()           # name -> requests currently using it; never evicted
+        self.stats = {}
+        self._lock = asyncio.Lock()
+
+    def _model_stats(self, name):
+        return self.stats.setdefault(name, {"hits": 0, "misses": 0, "evictions": 0,
+                                            "cold_starts": 0, "cold_start_ms_total": 0.0, "cold_start_ms_last": None})
+
+    def _touch(self, name):
+        self.resident[name] = time.time()
+        self.resident.move_to_end(name)
+
+    def _available_mb(self):
+        return rc._read_mem_available_kb() // 1024
+
+    async def _evict(self, name):
+        await rc.pause_role(name)
+        self.resident.pop(name, None)
+        self._model_stats(name)["evictions"] += 1
+
+    def _fits_without_pausing(self, need_mb, models):
+        """True if need_mb fits in MemAvailable plus what evicting idle specialists would free."""
+        with TRACER.span("fits_without_pausing", need_mb=need_mb) as span:
+            freeable = sum(estimate_footprint_mb(m) for n in self.resident if self.pins[n] == 0
+                           for m in [rc.get_model_by_name(n, models=models)] if m)
+            available = self._available_mb()
+            ok = available + freeable >= need_mb
+            span.update(mem_available_mb=available, freeable_mb=freeable, fits=ok)
+            return ok
+
+    async def _make_room(self, need_mb, allow_pause=True):
+        """Evict LRU specialists, then pause librarian/gatekeeper, until need_mb fits."""
+        with TRACER.span("make_room", need_mb=need_mb, allow_pause=allow_pause) as span:
+            models = rc.load_models()
+            baseline = self._available_mb()
+            evicted, paused = [], []
+            span.update(mem_available_mb=baseline, evicted=evicted, paused=paused)
+            freed = 0
+            fits = lambda: max(self._available_mb(), baseline + freed) >= need_mb
+            for name in list(self.resident):
+                if fits():
+                    break
+                if self.pins[name] > 0:
+                    continue
+                model = rc.get_model_by_name(name, models=models)
+                await self._evict(name)
+                evicted.append(name)
+                freed += estimate_footprint_mb(model) if model else 0
+            for role in ("librarian", "gatekeeper") if allow_pause else ():
+                if fits():
+                    break
+                if role in self.paused:
+                    continue
+                model = (rc.list_models_by_role(role, models=models) or [None])[0]
+                if not model:
+                    continue
+                await rc.pause_role(role)
+                self.paused.append(role)
+                paused.append(role)
+                freed += estimate_footprint_mb(model)
+            ok = fits()
+            span.update(freed_mb=freed, fits=ok)
+            return ok
+
+    def _pin(self, name, pins):
+        self.pins[name] += pins() if callable(pins) else pins
+
+    async def acquire(self, preferred_name=None, domain=None, pins=1, allow_pause=True):
+        """
+        Return (ok, name, notes) for a running specialist, reusing a resident
+        one when any candidate is already loaded. The model is pinned for
+        pins users (an int, or a callable evaluated at hand-out time); each
+        must call release() when done. With allow_pause=False only
+        candidates that fit without pausing the Gatekeeper/Librarian are
+        started. Cancelling a cold start stops the half-loaded server.
+        """
+        with TRACER.span("pool_acquire", preferred=preferred_name, domain=domain, allow_pause=allow_pause) as span:
+            ok, name, notes = await self._acquire(preferred_name, domain, pins, allow_pause)
+            span.update(ok=ok, model=name, notes=notes)
+            return ok, name, notes
+
+    async def _acquire(self, preferred_name, domain, pins, allow_pause):
+        async with self._lock:
+            models = rc.load_models()
+            candidates = rc.choose_fallback_specialist(domain, models=models)
+            if preferred_name:
+                pref = rc.get_model_by_name(preferred_name, models=models)
+                if pref:
+                    candidates = [pref] + [m for m in candidates if m["name"] != preferred_name]
+
+            for cand in candidates:
+                if cand["name"] in self.resident:
+                    self._model_stats(cand["name"])["hits"] += 1
+                    self._touch(cand["name"])
+                    self._pin(cand["name"], pins)
+                    return True, cand["name"], "resident"
+
+            if rc._read_cpu_load() > 0.92:
+                return False, "", "cpu_busy"
+            # Prefer models known to load within budget; fall back to the rest
+            fast = [c for c in candidates if SUPERVISOR.expected_load_s(c) <= MAX_COLD_START_S]
+            candidates = fast + [c for c in candidates if c not in fast]
+            # A candidate that fits next to the Gatekeeper and Librarian beats
+            # a preferred one that would force pausing them
+            fitting = [c for c in candidates
+                       if self._fits_without_pausing(estimate_footprint_mb(c) + self.reserve_mb, models)]
+            attempts = [(c, False) for c in fitting]
+            if allow_pause:
+                attempts += [(c, True) for c in candidates if c not in fitting]
+            for cand, pause in attempts:
+                st = self._model_stats(cand["name"])
+                need = estimate_footprint_mb(cand) + self.reserve_mb
+                if not await self._make_room(need, pause):
+                    continue
+                st["misses"] += 1
+                t0 = time.perf_counter()
+                try:
+                    ok, detail = await SUPERVISOR.start(cand)
+                except asyncio.CancelledError:
+                    await SUPERVISOR.abandon(cand)
+                    raise
+                if not ok:
+                    await rc.pause_role(cand["name"])
+                    continue
+                ms = (time.perf_counter() - t0) * 1000
+                st["cold_starts"] += 1
+                st["cold_start_ms_total"] += ms
+                st["cold_start_ms_last"] = round(ms, 1)
+                self._touch(cand["name"])
+                self._pin(cand["name"], pins)
+                return True, cand["name"], "cold_start"
+
+            await self._resume_paused()
+            return False, "", "no_specialist_available"
+
+    async def _resume_paused(self):
+        # Restart in the background; requests to these ports queue until ready
+        models = rc.load_models()
+        for role in reversed(self.paused):
+            for m in rc.list_models_by_role(role, models=models)[:1]:
+                SUPERVISOR.start_background(m)
+        self.paused.clear()
+
+    async def release(self, name):
+        """
+        Unpin a specialist. Once no specialist is in use, always-on roles that
+        were paused to make room are resumed, evicting specialists as needed.
+        """
+        async with self._lock:
+            if self.pins[name] > 0:
+                self.pins[name] -= 1
+            if name in self.resident:
+                self._touch(name)
+            if not self.paused or any(self.pins[n] > 0 for n in self.resident):
+                return
+            models = rc.load_models()
+            need = sum(estimate_footprint_mb(m) for r in self.paused
+                       for m in rc.list_models_by_role(r, models=models)[:1])
+            for victim in list(self.resident):
+                if self._available_mb() >= need + self.reserve_mb:
+                    break
+                await self._evict(victim)
+            await self._resume_paused()
+
+    async def shutdown(self):
+        async with self._lock:
+            for name in list(self.resident):
+                await self._evict(name)
+            await self._resume_paused()
+
+    def snapshot(self):
+        out = {}
+        for name, st in self.stats.items():
+            avg = st["cold_start_ms_total"] / st["cold_starts"] if st["cold_starts"] else None
+            out[name] = {"hits": st["hits"], "misses": st["misses"], "evictions": st["evictions"],
+                         "cold_start_ms_last": st["cold_start_ms_last"],
+                         "cold_start_ms_avg": round(avg, 1) if avg is not None else None}
+        return {"resident": list(self.resident), "paused": list(self.paused),
+                "in_use": {n: c for n, c in self.pins.items() if c > 0}, "models": out}
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import os, time, asyncio
+from collections import deque
+import resource_controller as rc
+from http_client import get_client
+from tracing import TRACER
+
+READY_TIMEOUT = float(os.environ.get("ULTRA_AI_READY_TIMEOUT", "180"))
+REFUSED_GRACE = 15.0        # seconds a freshly spawned server may take to bind its port
+DEFAULT_LOAD_MB_PER_S = 250 # storage read rate assumed before a model has been measured
+
+class StartupSupervisor:
+    """
+    Starts llama-server instances and waits for /health to report ready.
+    Concurrent starts of the same model share one warm-up, and requests to a
+    warming port are queued by the HTTP client until it is ready.
+    """
+    def __init__(self):
+        self._warming = {}          # name -> task
+        self.load_times = {}        # name -> deque of seconds
+        self.failures = {}
+
+    async def wait_ready(self, port, timeout=READY_TIMEOUT):
+        """Poll /health with exponential backoff. Returns True once it answers 200."""
+        start = time.monotonic()
+        delay = 0.1
+        while time.monotonic() - start < timeout:
+            status = await get_client().health(port)
+            if status == 200:
+                return True
+            if status is None and time.monotonic() - start > REFUSED_GRACE:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2.0)
+        return False
+
+    async def _start(self, model):
+        with TRACER.span("warmup", model=model["name"], port=model["port"]) as span:
+            ok, detail = await self._warm(model)
+            span.update(ok=ok, detail=detail)
+            return ok, detail
+
+    async def _warm(self, model):
+        name = model["name"]
+        t0 = time.perf_counter()
+        code, out, err = await rc.resume_role(name)
+        if code != 0:
+            self.failures[name] = self.failures.get(name, 0) + 1
+            return False, (err or out).strip() or f"exit {code}"
+        with TRACER.span("wait_ready", port=model["port"]) as span:
+            span["ready"] = await self.wait_ready(model["port"])
+        if not span["ready"]:
+            self.failures[name] = self.failures.get(name, 0) + 1
+            return False, "not_ready"
+        self.load_times.setdefault(name, deque(maxlen=5)).append(time.perf_counter() - t0)
+        await rc.restore_slots(model)
+        return True, "ready"
+
+    async def start(self, model):
+        """
+        Start model (if needed) and wait until it serves requests.
+        Returns (ok, detail). Callers for a model already warming join it.
+        """
+        name = model["name"]
+        task = self._warming.get(name)
+        if task is None:
+            task = asyncio.ensure_future(self._start(model))
+            self._warming[name] = task
+            ready = asyncio.get_running_loop().create_future()
+            get_client().mark_warming(model["port"], ready)
+
+            def done(t):
+                self._warming.pop(name, None)
+                if not ready.done():
+                    ready.set_result(not t.cancelled() and t.exception() is None and t.result()[0])
+            task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+    async def abandon(self, model):
+        """Give up on a start nobody waits for any more and stop the half-loaded server."""
+        task = self._warming.get(model["name"])
+        if task is not None:
+            task.cancel()
+        await rc.pause_role(model["name"])
+
+    def start_background(self, model):
+        """Kick off a start without waiting; requests to its port will queue."""
+        asyncio.ensure_future(self.start(model))
+
+    def is_warming(self, name):
+        return name in self._warming
+
+    def expected_load_s(self, model):
+        """Measured average load time, or a size-based guess before the first load."""
+        times = self.load_times.get(model["name"])
+        if times:
+            return sum(times) / len(times)
+        try:
+            size_mb = os.path.getsize(model["path"]) / (1024 * 1024)
+        except Exception:
+            size_mb = 4096
+        return size_mb / DEFAULT_LOAD_MB_PER_S
+
+    def snapshot(self):
+        out = {}
+        for name, times in self.load_times.items():
+            out[name] = {"loads": len(times), "last_s": round(times[-1], 2),
+                         "avg_s": round(sum(times) / len(times), 2)}
+        return {"warming": sorted(self._warming), "load_times": out, "failures": dict(self.failures)}
+
+SUPERVISOR = StartupSupervisor()
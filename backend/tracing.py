@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import os, json, time, uuid, random, asyncio
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+TRACE_PATH = Path(__file__).resolve().parent.parent / "data" / "traces.jsonl"
+TRACE_SAMPLE = float(os.environ.get("ULTRA_AI_TRACE_SAMPLE", "0.1"))        # share of requests kept
+TRACE_SLOW_MS = float(os.environ.get("ULTRA_AI_TRACE_SLOW_MS", "10000"))   # slower requests are always kept
+TRACE_FILE_BYTES = int(float(os.environ.get("ULTRA_AI_TRACE_MB", "4")) * 1024 * 1024)
+TRACE_BACKUPS = 2           # traces.jsonl.1, traces.jsonl.2
+TRACE_RECENT = 200          # kept traces held in memory for /debug/traces
+
+# (trace, id of the innermost open span) for the running task; asyncio tasks
+# inherit it, so work spawned by a request is traced under that request
+_current = ContextVar("ultra_ai_trace", default=None)
+
+class Trace:
+    def __init__(self, name, attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started = time.time()
+        self.t0 = time.perf_counter()
+        self.spans = []
+        self.duration_ms = None
+        self.error = None
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "name": self.name, "started": round(self.started, 3), "duration_ms": self.duration_ms,
+                "error": self.error, "attrs": self.attrs, "spans": self.spans}
+
+class Tracer:
+    """
+    Per-request traces made of nested spans (model calls, resource checks,
+    script runs, warm-ups, serialization). Every request is traced; when
+    it finishes the trace is kept if it was sampled (sample rate), slow
+    (>= slow_ms) or failed. Kept traces are appended to a size-rotated
+    JSONL file and the most recent ones are served by /debug/traces.
+    """
+    def __init__(self, path: Path | None = TRACE_PATH, sample=TRACE_SAMPLE, slow_ms=TRACE_SLOW_MS,
+                 max_bytes=TRACE_FILE_BYTES, backups=TRACE_BACKUPS, keep=TRACE_RECENT):
+        self.path = path
+        self.sample = sample
+        self.slow_ms = slow_ms
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.recent = deque(maxlen=keep)
+        self.stats = {"traces": 0, "kept": 0, "slow": 0, "errors": 0, "rotations": 0, "write_errors": 0}
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """Trace the enclosed block as one request; yields the Trace."""
+        trace = Trace(name, attrs)
+        token = _current.set((trace, None))
+        try:
+            yield trace
+        except asyncio.CancelledError:
+            trace.error = "cancelled"
+            raise
+        except BaseException as e:
+            trace.error = str(e) or type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            self._finish(trace)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Time the enclosed block as a child of the current span; yields its attrs dict."""
+        current = _current.get()
+        if current is None or current[0].duration_ms is not None:
+            yield attrs
+            return
+        trace, parent = current
+        span = {"id": len(trace.spans) + 1, "parent": parent, "name": name,
+                "start_ms": round((time.perf_counter() - trace.t0) * 1000, 2), "duration_ms": None, "attrs": attrs}
+        trace.spans.append(span)
+        token = _current.set((trace, span["id"]))
+        t0 = time.perf_counter()
+        try:
+            yield attrs
+        except asyncio.CancelledError:
+            span["cancelled"] = True
+            raise
+        except BaseException as e:
+            span["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            span["duration_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            _current.reset(token)
+
+    def annotate(self, **attrs):
+        """Add attributes to the innermost open span (or the trace itself)."""
+        current = _current.get()
+        if current is None:
+            return
+        trace, span_id = current
+        target = trace.spans[span_id - 1]["attrs"] if span_id else trace.attrs
+        target.update(attrs)
+
+    def current_id(self) -> str | None:
+        current = _current.get()
+        return current[0].id if current else None
+
+    def _finish(self, trace: Trace):
+        trace.duration_ms = round((time.perf_counter() - trace.t0) * 1000, 2)
+        self.stats["traces"] += 1
+        slow = trace.duration_ms >= self.slow_ms
+        failed = trace.error is not None or any("error" in s for s in trace.spans)
+        if not (slow or failed or random.random() < self.sample):
+            return
+        self.stats["kept"] += 1
+        self.stats["slow"] += slow
+        self.stats["errors"] += failed
+        record = trace.to_dict()
+        self.recent.append(record)
+        if self.path:
+            self._append(record)
+
+    def _append(self, record: dict):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self.path.exists() and self.path.stat().st_size >= self.max_bytes:
+                self._rotate()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            self.stats["write_errors"] += 1
+            print(f"Trace write error: {e}")
+
+    def _rotate(self):
+        for i in range(self.backups, 0, -1):
+            src = self.path if i == 1 else self.path.with_name(f"{self.path.name}.{i - 1}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{i}"))
+        self.stats["rotations"] += 1
+
+    def find(self, trace_id: str) -> dict | None:
+        return next((t for t in reversed(self.recent) if t["id"] == trace_id), None)
+
+    def query(self, limit: int = 20, min_ms: float = 0.0) -> list:
+        """Most recent kept traces first, optionally only those slower than min_ms."""
+        out = [t for t in reversed(self.recent) if (t["duration_ms"] or 0) >= min_ms]
+        return out[:limit]
+
+    def hot_spans(self) -> dict:
+        """Total and max time per span name over the kept traces, slowest total first."""
+        agg = {}
+        for t in self.recent:
+            for s in t["spans"]:
+                a = agg.setdefault(s["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                ms = s["duration_ms"] or 0.0
+                a["count"] += 1
+                a["total_ms"] = round(a["total_ms"] + ms, 2)
+                a["max_ms"] = max(a["max_ms"], ms)
+        return dict(sorted(agg.items(), key=lambda kv: -kv[1]["total_ms"]))
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "sample": self.sample, "slow_ms": self.slow_ms, "recent": len(self.recent),
+                "path": str(self.path) if self.path else None}
+
+TRACER = Tracer(path=TRACE_PATH if os.environ.get("ULTRA_AI_TRACE_PERSIST", "1") != "0" else None)
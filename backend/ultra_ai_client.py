@@ -6,6 +6,7 @@ HTTP-based client for communicating with the aiohttp API server.
 """
 
 import asyncio
+import math
 import sys
 import time
 from pathlib import Path
@@ -29,9 +30,47 @@ WHITE = '\033[1;37m'
 GRAY = '\033[0;37m'
 NC = '\033[0m'  # No Color
 
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))]
+
+def read_batch(path: str) -> list:
+    """Load batch queries from a JSONL file ("-" for stdin); plain text lines are taken as queries."""
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    records = []
+    try:
+        for n, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                rec = line
+            if isinstance(rec, str):
+                rec = {"text": rec}
+            if not isinstance(rec, dict) or not rec.get("text"):
+                print(f"{YELLOW}⚠️  Skipping line {n}: no \"text\"{NC}", file=sys.stderr)
+                continue
+            rec.setdefault("id", n)
+            records.append(rec)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return records
+
 class UltraAIClient:
-    def __init__(self, server_url: str = "http://127.0.0.1:8765/api"):
+    def __init__(self, server_url: str = "http://127.0.0.1:8765/api", stream: bool = True, conversation: bool = True,
+                 deadline: float | None = None):
         self.server_url = server_url
+        self.stream_url = server_url.rstrip("/") + "/stream"
+        self.stream = stream
+        self.conversation = conversation
+        self.session_id = None  # server-side conversation, assigned by the first reply
+        self.deadline = deadline  # seconds the server may spend per answer (server default if None)
         self.session = None
 
     def print_banner(self):
@@ -60,17 +99,32 @@ class UltraAIClient:
             await self.session.close()
             self.session = None
 
-    async def send_query(self, query: str, dive_confirmed: bool = False) -> dict:
-        """Send query to server and receive JSON response"""
+    async def send_query(self, query: str, dive_confirmed: bool = False, on_event=None) -> dict:
+        """Send query to server and receive JSON response.
+        With on_event, the streaming endpoint is used and every stage/token
+        event is passed to on_event before the final response is returned."""
         payload = {
             "text": query,
             "dive_confirmed": dive_confirmed
         }
+        if self.conversation:
+            payload["session_id"] = self.session_id
+        if self.deadline:
+            payload["deadline_s"] = self.deadline
+        url = self.stream_url if on_event else self.server_url
+        # The server answers within the deadline; allow a little slack for the reply itself
+        timeout = self.deadline + 15 if self.deadline else 300
         
         try:
-            async with self.session.post(self.server_url, json=payload, timeout=300) as resp:
+            async with self.session.post(url, json=payload, timeout=timeout) as resp:
                 if resp.status == 200:
-                    return await resp.json()
+                    if on_event is None:
+                        result = await resp.json()
+                    else:
+                        result = await self._read_stream(resp, on_event)
+                    if self.conversation and result.get("session_id"):
+                        self.session_id = result["session_id"]
+                    return result
                 else:
                     return {"status": "error", "message": f"Server error: {resp.status}"}
         except aiohttp.ClientConnectorError:
@@ -80,11 +134,109 @@ class UltraAIClient:
         except Exception as e:
             return {"status": "error", "message": f"Communication error: {e}"}
 
+    async def _read_stream(self, resp, on_event) -> dict:
+        """Consume NDJSON events until the final "done" line."""
+        async for raw in resp.content:
+            line = raw.decode("utf-8", errors="ignore").strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            if event.get("type") == "done":
+                event.pop("type")
+                return event
+            on_event(event)
+        return {"status": "error", "message": "Response stream ended early"}
+
+    def print_stream_event(self, event: dict):
+        """Render streamed stage markers and tokens as they arrive"""
+        if event.get("type") == "stage":
+            print(f"\n{GRAY}[{event.get('stage')}]{NC} ", end="", flush=True)
+        elif event.get("type") == "token":
+            print(event.get("text", ""), end="", flush=True)
+        elif event.get("type") == "discard":
+            print(f" {GRAY}(set aside){NC}", end="", flush=True)
+
+    async def ask(self, query: str, dive_confirmed: bool = False) -> dict:
+        """Send a query, streaming tokens to the terminal when enabled"""
+        if not self.stream:
+            return await self.send_query(query, dive_confirmed)
+        response_json = await self.send_query(query, dive_confirmed, on_event=self.print_stream_event)
+        print()
+        return response_json
+
+    async def _timed_query(self, rec: dict, dive_confirmed: bool) -> tuple:
+        """One request; returns (response, latency ms, first-token ms or None)."""
+        t0 = time.perf_counter()
+        first = []
+
+        def on_event(event):
+            if event.get("type") == "token" and not first:
+                first.append(time.perf_counter())
+
+        response = await self.send_query(rec["text"], dive_confirmed, on_event=on_event if self.stream else None)
+        latency = (time.perf_counter() - t0) * 1000
+        return response, latency, (first[0] - t0) * 1000 if first else None
+
+    async def run_batch(self, records: list, concurrency: int = 4, out=None, auto_dive: bool = True) -> dict:
+        """
+        Replay records ({"text", "dive_confirmed"?, "id"?}) with up to
+        concurrency requests in flight over the shared session. Each result
+        is written to out as one JSON line as soon as it completes;
+        needs_deeper answers are retried with dive_confirmed when auto_dive.
+        Returns throughput, status/source counts and latency percentiles.
+        """
+        out = out or sys.stdout
+        sem = asyncio.Semaphore(max(1, concurrency))
+        results = []
+
+        async def one(rec):
+            async with sem:
+                response, latency, ttft = await self._timed_query(rec, bool(rec.get("dive_confirmed")))
+                dived = False
+                if response.get("status") == "needs_deeper" and auto_dive:
+                    dived = True
+                    response, dive_ms, dive_ttft = await self._timed_query(rec, True)
+                    ttft = latency + dive_ttft if dive_ttft is not None else ttft
+                    latency += dive_ms
+            row = {"id": rec["id"], "text": rec["text"], "status": response.get("status"),
+                   "source": response.get("source"), "cached": bool(response.get("cached")), "dived": dived,
+                   "latency_ms": round(latency, 1), "ttft_ms": round(ttft, 1) if ttft is not None else None,
+                   "answer": response.get("answer"), "error": response.get("message") if response.get("status") == "error" else None}
+            results.append(row)
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(r) for r in records))
+        wall = time.perf_counter() - t0
+
+        latencies = [r["latency_ms"] for r in results]
+        ttfts = [r["ttft_ms"] for r in results if r["ttft_ms"] is not None]
+        count = lambda key: dict(sorted(((v, sum(1 for r in results if r[key] == v)) for v in {r[key] for r in results}), key=str))
+        return {"requests": len(results), "concurrency": concurrency, "wall_s": round(wall, 3),
+                "rps": round(len(results) / wall, 2) if wall else None,
+                "status": count("status"), "source": count("source"), "dived": sum(r["dived"] for r in results),
+                "latency_ms": {f"p{int(q * 100)}": percentile(latencies, q) for q in (0.5, 0.9, 0.95, 0.99)},
+                "ttft_ms": {f"p{int(q * 100)}": percentile(ttfts, q) for q in (0.5, 0.95)} if ttfts else None}
+
+    def print_batch_summary(self, summary: dict):
+        """Human-readable batch summary on stderr (stdout may carry the JSONL results)"""
+        err = sys.stderr
+        print(f"\n{CYAN}Batch: {summary['requests']} requests, concurrency {summary['concurrency']}, "
+              f"{summary['wall_s']}s, {summary['rps']} req/s{NC}", file=err)
+        print(f"  status: {summary['status']}", file=err)
+        print(f"  source: {summary['source']}  (dived: {summary['dived']})", file=err)
+        lat = summary["latency_ms"]
+        print(f"  latency ms: p50={lat['p50']} p90={lat['p90']} p95={lat['p95']} p99={lat['p99']}", file=err)
+        if summary["ttft_ms"]:
+            print(f"  first token ms: p50={summary['ttft_ms']['p50']} p95={summary['ttft_ms']['p95']}", file=err)
+
     def print_help(self):
         """Display help information"""
         print(f"\n{CYAN}Ultra AI Client Commands:{NC}")
         print(f"  {WHITE}help{NC}      - Show this help message")
         print(f"  {WHITE}clear{NC}     - Clear the screen")
+        print(f"  {WHITE}new{NC}       - Start a new conversation")
         print(f"  {WHITE}exit{NC}      - Exit the client")
         print(f"  {WHITE}quit{NC}      - Exit the client")
         print(f"  {WHITE}bye{NC}       - Exit the client")
@@ -150,12 +302,16 @@ class UltraAIClient:
                     elif query.lower() == 'clear':
                         print('\033[2J\033[H', end='')  # Clear screen
                         continue
+                    elif query.lower() == 'new':
+                        self.session_id = None
+                        print(f"{BLUE}Started a new conversation.{NC}")
+                        continue
                     
                     # Send query to server
                     print(f"{GRAY}🤔 Processing...{NC}")
                     start_time = time.time()
                     
-                    response_json = await self.send_query(query)
+                    response_json = await self.ask(query)
                     
                     processing_time = time.time() - start_time
                     
@@ -166,7 +322,7 @@ class UltraAIClient:
                         if deeper_choice == 'y':
                             print(f"{GRAY}🤔 Diving deeper...{NC}")
                             start_time = time.time()
-                            response_json = await self.send_query(query, dive_confirmed=True)
+                            response_json = await self.ask(query, dive_confirmed=True)
                             processing_time = time.time() - start_time
                         else:
                             print(f"{BLUE}Okay, stopping.{NC}")
@@ -214,6 +370,48 @@ async def main_async():
         "--query",
         help="Single query mode - send one query and exit"
     )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="Batch mode - send every query in a JSONL file (\"-\" for stdin) and report throughput/latency"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Requests in flight at once in batch mode (default: 4)"
+    )
+    parser.add_argument(
+        "--output",
+        metavar="FILE",
+        help="Write batch results as JSONL to FILE instead of stdout"
+    )
+    parser.add_argument(
+        "--no-dive",
+        action="store_true",
+        help="In batch mode, record needs_deeper answers instead of confirming Dive Deeper"
+    )
+    parser.add_argument(
+        "--summary-json",
+        metavar="FILE",
+        help="Also write the batch summary to FILE as JSON"
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        help="Ask the server to answer within SECONDS, skipping optional passes if needed"
+    )
+    parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="Wait for complete answers instead of streaming tokens"
+    )
+    parser.add_argument(
+        "--no-history",
+        action="store_true",
+        help="Send every query on its own instead of as one conversation"
+    )
     parser.add_argument(
         "--no-color",
         action="store_true",
@@ -227,10 +425,24 @@ async def main_async():
         global RED, GREEN, YELLOW, BLUE, PURPLE, CYAN, WHITE, GRAY, NC
         RED = GREEN = YELLOW = BLUE = PURPLE = CYAN = WHITE = GRAY = NC = ""
     
-    client = UltraAIClient(args.server)
+    # Batch queries are independent, so they never share a conversation
+    client = UltraAIClient(args.server, stream=not args.no_stream,
+                           conversation=not (args.no_history or args.batch), deadline=args.deadline)
     await client.create_session()
 
-    if args.query:
+    if args.batch:
+        records = read_batch(args.batch)
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            summary = await client.run_batch(records, args.concurrency, out, auto_dive=not args.no_dive)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        client.print_batch_summary(summary)
+        if args.summary_json:
+            Path(args.summary_json).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+
+    elif args.query:
         # Single query mode
         response_json = await client.send_query(args.query)
         if response_json.get("status") == "ok":
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Stub llama.cpp server for offline benchmarks.
+
+Implements the parts of llama-server the orchestrator uses: POST /completion
+(plain and stream=True, one request per slot at a time), GET /health (503
+while "loading") and POST /slots/{id}.
+Latency, LOWCONF answers and failures are configurable so pipeline paths can
+be driven without real models.
+"""
+import json, time, random, asyncio
+from aiohttp import web
+
+# Markers a benchmark query can carry to force a pipeline path
+LIB_MARKER = "[lib]"        # Gatekeeper says LOWCONF, Librarian answers
+DIVE_MARKER = "[dive]"      # Gatekeeper and Librarian both fall short
+
+class FakeLlamaServer:
+    def __init__(self, port, role="gatekeeper", token_latency_ms=5.0, prompt_latency_ms=0.02,
+                 n_tokens=32, lowconf_rate=0.0, failure_rate=0.0, load_time_s=0.0, slots=1, seed=None):
+        self.port = port
+        self.role = role
+        self.token_latency = token_latency_ms / 1000
+        self.prompt_latency = prompt_latency_ms / 1000
+        self.n_tokens = n_tokens
+        self.lowconf_rate = lowconf_rate
+        self.failure_rate = failure_rate
+        self.load_time_s = load_time_s
+        self.n_slots = slots
+        self._busy = None       # one request decodes per slot at a time, like --parallel
+        self.rng = random.Random(seed)
+        self.started = None
+        self.runner = None
+        self.stats = {"completions": 0, "failures": 0, "cancelled": 0, "bad_slot": 0}
+
+    def _answer(self, prompt):
+        low = self.role == "gatekeeper" and "LOWCONF" in prompt and (
+            LIB_MARKER in prompt or DIVE_MARKER in prompt or self.rng.random() < self.lowconf_rate)
+        if low:
+            return ["LOWCONF"]
+        if self.role == "librarian" and DIVE_MARKER in prompt:
+            return ["n/a"]
+        words = ["This", "is", "a", "synthetic", "answer", "from", self.role]
+        return [words[i % len(words)] for i in range(self.n_tokens)]
+
+    async def completion(self, request):
+        if self.started is None or time.monotonic() - self.started < self.load_time_s:
+            return web.json_response({"error": "loading model"}, status=503)
+        data = await request.json()
+        prompt = data.get("prompt", "")
+        if self.rng.random() < self.failure_rate:
+            self.stats["failures"] += 1
+            return web.json_response({"error": "injected failure"}, status=500)
+        slot = int(data.get("id_slot", -1))
+        if slot >= self.n_slots:
+            self.stats["bad_slot"] += 1
+            return web.json_response({"error": f"invalid slot {slot}"}, status=400)
+        if self._busy is None:
+            self._busy = asyncio.Semaphore(self.n_slots)
+        async with self._busy:
+            return await self._generate(request, data, prompt)
+
+    async def _generate(self, request, data, prompt):
+        self.stats["completions"] += 1
+        tokens = self._answer(prompt)[:max(1, int(data.get("n_predict", self.n_tokens)))]
+        await asyncio.sleep(self.prompt_latency * len(prompt))
+        timings = {"prompt_n": len(prompt) // 4, "predicted_n": len(tokens),
+                   "predicted_ms": round(self.token_latency * len(tokens) * 1000, 3)}
+        if not data.get("stream"):
+            await asyncio.sleep(self.token_latency * len(tokens))
+            return web.json_response({"content": " ".join(tokens), "stop": True, "timings": timings,
+                                      "tokens_cached": 0, "id_slot": data.get("id_slot", 0)})
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        try:
+            for i, tok in enumerate(tokens):
+                await asyncio.sleep(self.token_latency)
+                piece = tok if i == 0 else " " + tok
+                await resp.write(f"data: {json.dumps({'content': piece, 'stop': False})}\n\n".encode())
+            await resp.write(f"data: {json.dumps({'content': '', 'stop': True, 'timings': timings})}\n\n".encode())
+        except (ConnectionResetError, asyncio.CancelledError):
+            self.stats["cancelled"] += 1
+            raise
+        return resp
+
+    async def health(self, request):
+        if self.started is None or time.monotonic() - self.started < self.load_time_s:
+            return web.json_response({"status": "loading model"}, status=503)
+        return web.json_response({"status": "ok"})
+
+    async def slots(self, request):
+        return web.json_response({"id_slot": int(request.match_info["id"]), "n_saved": 0, "n_restored": 0})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/completion", self.completion)
+        app.router.add_get("/health", self.health)
+        app.router.add_post("/slots/{id}", self.slots)
+        self.runner = web.AppRunner(app, handler_cancellation=True)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", self.port).start()
+        self.started = time.monotonic()
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+class FakeFleet:
+    """
+    Stands in for start_model.sh / stop_model.sh: "starting" a model brings up
+    a FakeLlamaServer on its port (specialists answer 503 on /health for
+    specialist_load_s), "stopping" tears it down. Every call is recorded in
+    self.events.
+    """
+    def __init__(self, models, specialist_load_s=0.0, **server_kwargs):
+        self.models = models
+        self.specialist_load_s = specialist_load_s
+        self.server_kwargs = server_kwargs
+        self.servers = {}
+        self.events = []
+
+    def _resolve(self, name_or_role):
+        for m in self.models:
+            if m["name"] == name_or_role:
+                return m
+        for m in self.models:
+            if m.get("role") == name_or_role:
+                return m
+        return None
+
+    async def start_model(self, name_or_role):
+        m = self._resolve(name_or_role)
+        if not m:
+            return 3, "", f"Model not found for: {name_or_role}"
+        self.events.append(("start", m["name"], time.monotonic()))
+        if m["name"] not in self.servers:
+            kwargs = dict(self.server_kwargs)
+            kwargs["load_time_s"] = self.specialist_load_s if m.get("role") == "specialist" else 0.0
+            srv = FakeLlamaServer(m["port"], role=m.get("role"), slots=int(m.get("slots", 1)), **kwargs)
+            await srv.start()
+            self.servers[m["name"]] = srv
+        return 0, "OK", ""
+
+    async def stop_model(self, name_or_role):
+        m = self._resolve(name_or_role)
+        if not m:
+            return 3, "", f"Model not found for: {name_or_role}"
+        self.events.append(("stop", m["name"], time.monotonic()))
+        srv = self.servers.pop(m["name"], None)
+        if srv:
+            await srv.stop()
+        return 0, f"Stopped {m['name']}", ""
+
+    async def stop_all(self):
+        for name in list(self.servers):
+            await self.servers.pop(name).stop()
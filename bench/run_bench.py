@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the orchestrator pipeline.
+
+Runs backend/main.py's app against stub llama.cpp servers (fake_llama.py) on
+shifted ports, with start_model.sh/stop_model.sh replaced by an in-process
+fleet, then drives /api (or /api/stream) at the requested concurrency levels
+and reports p50/p95/p99 latency per pipeline path plus requests/sec.
+
+  python bench/run_bench.py --concurrency 1,4,8 --requests 60
+"""
+import os, sys, json, time, uuid, random, asyncio, argparse, tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_llama import FakeFleet, LIB_MARKER, DIVE_MARKER
+from ultra_ai_client import percentile
+
+PATHS = {"gatekeeper": "", "librarian": LIB_MARKER, "specialist": DIVE_MARKER}
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in PATHS:
+            raise SystemExit(f"unknown path in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def prepare_config(port_base, tmp):
+    """Copy models.json with ports shifted so real llama-servers are untouched."""
+    models = json.loads((ROOT / "models.json").read_text(encoding="utf-8"))
+    base = min(m["port"] for m in models)
+    for m in models:
+        m["port"] = m["port"] - base + port_base
+    cfg = Path(tmp) / "models.json"
+    cfg.write_text(json.dumps(models, indent=2), encoding="utf-8")
+    return cfg, models
+
+async def run_level(client, url, concurrency, n_requests, mix, stream, speculative, rng, dup_rate=0.0):
+    paths = rng.choices(list(mix), weights=list(mix.values()), k=n_requests)
+    # Duplicates share a per-level question, like retries or several tabs asking at once
+    level = uuid.uuid4().hex[:6]
+    texts = [f"hot question {level}" if rng.random() < dup_rate else f"bench question {uuid.uuid4().hex[:12]}"
+             for _ in paths]
+    sem = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(path, text):
+        payload = {"text": f"{PATHS[path]} {text}".strip(),
+                   "dive_confirmed": path == "specialist", "speculative": speculative}
+        async with sem:
+            t0 = time.perf_counter()
+            status, source = "error", None
+            try:
+                async with client.post(url, json=payload) as r:
+                    if stream:
+                        body = None
+                        async for raw in r.content:
+                            line = raw.decode().strip()
+                            if line:
+                                ev = json.loads(line)
+                                if ev.get("type") == "done":
+                                    body = ev
+                    else:
+                        body = await r.json()
+                    if body:
+                        status, source = body.get("status", "error"), body.get("source")
+            except Exception:
+                pass
+            samples.append({"path": path, "status": status, "source": source,
+                            "ms": (time.perf_counter() - t0) * 1000})
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(p, t) for p, t in zip(paths, texts)))
+    wall = time.perf_counter() - t0
+    return samples, wall
+
+def summarize(samples, wall):
+    rows = {}
+    for path in PATHS:
+        lat = [s["ms"] for s in samples if s["path"] == path]
+        if not lat:
+            continue
+        ok = [s for s in samples if s["path"] == path and s["status"] == "ok"]
+        rows[path] = {"n": len(lat), "ok": len(ok),
+                      "p50_ms": round(percentile(lat, 0.50), 1),
+                      "p95_ms": round(percentile(lat, 0.95), 1),
+                      "p99_ms": round(percentile(lat, 0.99), 1)}
+    return {"requests": len(samples), "wall_s": round(wall, 3),
+            "rps": round(len(samples) / wall, 2) if wall else None, "paths": rows}
+
+def print_level(concurrency, summary):
+    print(f"\nconcurrency={concurrency}  requests={summary['requests']}  "
+          f"wall={summary['wall_s']}s  rps={summary['rps']}")
+    print(f"  {'path':<12}{'n':>5}{'ok':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for path, r in summary["paths"].items():
+        print(f"  {path:<12}{r['n']:>5}{r['ok']:>5}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+
+async def main_async(args):
+    tmp = tempfile.mkdtemp(prefix="ultra_ai_bench_")
+    cfg, models = prepare_config(args.port_base, tmp)
+    os.environ["ULTRA_AI_CONFIG"] = str(cfg)
+    os.environ["ULTRA_AI_CACHE_PERSIST"] = "0"
+    os.environ["ULTRA_AI_TRACE_PERSIST"] = "0"
+
+    import resource_controller as rc
+    import librarian
+    librarian.KB_DB = Path(tmp) / "kb.sqlite3"
+    import main as orchestrator
+    from aiohttp import ClientSession, web
+
+    fleet = FakeFleet(models, specialist_load_s=args.specialist_load_s,
+                      token_latency_ms=args.token_ms, n_tokens=args.tokens,
+                      lowconf_rate=args.lowconf_rate, failure_rate=args.failure_rate, seed=args.seed)
+    rc.start_model = fleet.start_model
+    rc.stop_model = fleet.stop_model
+    await fleet.start_model("gatekeeper")
+    await fleet.start_model("librarian")
+
+    runner = web.AppRunner(orchestrator.build_app(), handler_cancellation=True)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.api_port)
+    await site.start()
+    url = f"http://127.0.0.1:{args.api_port}/api" + ("/stream" if args.stream else "")
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    report = {"config": vars(args), "levels": {}}
+    try:
+        async with ClientSession() as client:
+            for c in [int(x) for x in args.concurrency.split(",")]:
+                samples, wall = await run_level(client, url, c, args.requests, mix,
+                                                args.stream, args.speculative, rng, args.dup_rate)
+                summary = summarize(samples, wall)
+                report["levels"][c] = summary
+                print_level(c, summary)
+            async with client.get(f"http://127.0.0.1:{args.api_port}/stats") as r:
+                report["stats"] = await r.json()
+    finally:
+        await runner.cleanup()
+        await fleet.stop_all()
+    report["lifecycle_events"] = len(fleet.events)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nwrote {args.json}")
+
+def main():
+    p = argparse.ArgumentParser(description="Ultra AI offline pipeline benchmark")
+    p.add_argument("--concurrency", default="1,4,8", help="comma-separated concurrency levels")
+    p.add_argument("--requests", type=int, default=40, help="requests per concurrency level")
+    p.add_argument("--mix", default="gatekeeper=0.6,librarian=0.3,specialist=0.1",
+                   help="path weights: gatekeeper, librarian (refine) and specialist (dive)")
+    p.add_argument("--token-ms", type=float, default=5.0, help="stub per-token latency")
+    p.add_argument("--tokens", type=int, default=32, help="tokens per stub answer")
+    p.add_argument("--lowconf-rate", type=float, default=0.0, help="extra random LOWCONF rate")
+    p.add_argument("--failure-rate", type=float, default=0.0, help="injected HTTP 500 rate")
+    p.add_argument("--dup-rate", type=float, default=0.0, help="share of requests repeating a hot question")
+    p.add_argument("--specialist-load-s", type=float, default=0.5, help="stub specialist warm-up time")
+    p.add_argument("--port-base", type=int, default=18082, help="first stub llama.cpp port")
+    p.add_argument("--api-port", type=int, default=18765, help="orchestrator port")
+    p.add_argument("--stream", action="store_true", help="drive /api/stream instead of /api")
+    p.add_argument("--speculative", action="store_true", help="enable speculative fan-out")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--json", help="write the full report to this file")
+    asyncio.run(main_async(p.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,19 @@
 const API_URL = "http://127.0.0.1:8765/api";
-const HEALTH_CHECK_TEXT = "test connection";
+const STREAM_URL = API_URL + "/stream";
+const STAGE_LABELS = {
+    gatekeeper: "Thinking...",
+    librarian: "Checking with the Librarian...",
+    refine: "Refining answer...",
+    specialist_start: "Starting a specialist...",
+    specialist: "Specialist answering...",
+    polish: "Polishing answer...",
+    fallback: "Preparing best-effort answer..."
+};
+const HEALTH_URL = "http://127.0.0.1:8765/health";
 
 const inputEl = document.getElementById("input");
 const sendBtn = document.getElementById("send");
+const newChatBtn = document.getElementById("new-chat");
 const outputEl = document.getElementById("output");
 const modeSel = document.getElementById("mode");
 const connPill = document.getElementById("conn-pill");
@@ -14,6 +25,8 @@ const modalNo = document.getElementById("modal-no");
 let divePendingText = "";
 let lastUserText = "";
 let isProcessing = false;
+// Server-side conversation; null asks the backend to start a new one
+let sessionId = sessionStorage.getItem("ultra_ai_session") || null;
 
 // Connection status check
 async function checkConnection() {
@@ -21,17 +34,17 @@ async function checkConnection() {
     connPill.className = "pill checking";
     
     try {
-        const res = await fetch(API_URL, { 
-            method: "POST", 
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ text: HEALTH_CHECK_TEXT })
-        });
+        const res = await fetch(HEALTH_URL);
+        if (!res.ok) throw new Error("Server error");
+        const health = await res.json();
         
-        if (res.ok) {
+        if (health.status === "ok") {
             connPill.textContent = "Online";
             connPill.className = "pill online";
         } else {
-            throw new Error("Server error");
+            // Orchestrator is up but the Gatekeeper is not serving yet
+            connPill.textContent = "Starting...";
+            connPill.className = "pill checking";
         }
     } catch (error) {
         connPill.textContent = "Offline";
@@ -52,6 +65,12 @@ inputEl.addEventListener("keypress", e => {
     }
 });
 
+newChatBtn.addEventListener("click", () => {
+    sessionId = null;
+    sessionStorage.removeItem("ultra_ai_session");
+    outputEl.textContent = "New conversation started.";
+});
+
 modalYes.addEventListener("click", async () => {
     modalBg.style.display = "none";
     await postToAPI(divePendingText, true);
@@ -86,17 +105,23 @@ async function postToAPI(text, dive_confirmed) {
             text, 
             dive_confirmed, 
             domain: null,
-            mode: mode
+            mode: mode,
+            session_id: sessionId
         };
         
-        const res = await fetch(API_URL, {
+        const streaming = typeof TextDecoder !== "undefined";
+        const res = await fetch(streaming ? STREAM_URL : API_URL, {
             method: "POST",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify(payload)
         });
         
         if (!res.ok) throw new Error(`Server error: ${res.status}`);
-        const data = await res.json();
+        const data = streaming && res.body ? await readStream(res) : await res.json();
+        if (data.session_id) {
+            sessionId = data.session_id;
+            sessionStorage.setItem("ultra_ai_session", sessionId);
+        }
         handleResponse(data, text);
         
     } catch (error) {
@@ -109,6 +134,39 @@ async function postToAPI(text, dive_confirmed) {
     }
 }
 
+// Read NDJSON events from /api/stream, rendering tokens as they arrive.
+// Returns the final "done" event, which carries the usual /api fields.
+async function readStream(res) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let streamed = "";
+    let final = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let idx;
+        while ((idx = buffer.indexOf("\n")) >= 0) {
+            const line = buffer.slice(0, idx).trim();
+            buffer = buffer.slice(idx + 1);
+            if (!line) continue;
+            const ev = JSON.parse(line);
+            if (ev.type === "stage" || ev.type === "discard") {
+                streamed = "";
+                outputEl.textContent = STAGE_LABELS[ev.stage] || "Thinking...";
+            } else if (ev.type === "token") {
+                streamed += ev.text;
+                outputEl.textContent = streamed;
+            } else if (ev.type === "done") {
+                final = ev;
+            }
+        }
+    }
+    return final || { status: "error", message: "Response stream ended early" };
+}
+
 // Handle backend response
 function handleResponse(data, userText) {
     if (data.status === "ok") {
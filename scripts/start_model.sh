@@ -30,6 +30,7 @@ PATH_TARGET=$(jq -r "map(select(.name==\"$NAME\"))[0].path" "$CFG")
 PORT=$(jq -r "map(select(.name==\"$NAME\"))[0].port" "$CFG")
 THREADS=$(jq -r "map(select(.name==\"$NAME\"))[0].threads" "$CFG")
 CTX=$(jq -r "map(select(.name==\"$NAME\"))[0].context" "$CFG")
+SLOTS=$(jq -r "map(select(.name==\"$NAME\"))[0].slots // 1" "$CFG")
 
 if [ ! -f "$PATH_TARGET" ]; then
     echo "Model file missing: $PATH_TARGET"
@@ -43,7 +44,10 @@ if lsof -i :"$PORT" >/dev/null 2>&1; then
 fi
 
 LOG="$ROOT/${NAME// /_}.log"
-echo "Starting $NAME on :$PORT ..."
-nohup "$BIN" -m "$PATH_TARGET" --host 127.0.0.1 --port "$PORT" --ctx-size "$CTX" --threads "$THREADS" --mlock=false --embedding=false --no-mmap=false > "$LOG" 2>&1 &
+SLOT_DIR="$ROOT/data/slots"
+mkdir -p "$SLOT_DIR"
+# "context" is per slot; llama-server splits --ctx-size across --parallel slots
+echo "Starting $NAME on :$PORT ($SLOTS slots) ..."
+nohup "$BIN" -m "$PATH_TARGET" --host 127.0.0.1 --port "$PORT" --ctx-size "$((CTX * SLOTS))" --parallel "$SLOTS" --cont-batching --threads "$THREADS" --slot-save-path "$SLOT_DIR" --mlock=false --embedding=false --no-mmap=false > "$LOG" 2>&1 &
 echo $! > "$ROOT/${NAME// /_}.pid"
 echo "OK"